@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+from re import search
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "toolify"))
+
+import analytics
+from fixtures import playlist_items
+from track_records import parse_items
+
+REPEAT = int(os.getenv("BENCH_REPEAT", 20))
+
+
+def legacy_analyze(songs):
+    year_rex = r"([0-9]{4})"
+    decades = {}
+    artists = {}
+    popularity = []
+
+    for song in songs:
+        year = search(year_rex, song["track"]["album"].get("release_date"))
+        if year:
+            year = year.group(1)
+            decade = year[:3] + "0s"
+            if decade not in decades:
+                decades[decade] = 1
+            else:
+                decades[decade] += 1
+
+        artist = song["track"].get("artists")
+        if artist:
+            artist = artist[0]["id"]
+            if artist not in artists:
+                artists[artist] = 1
+            else:
+                artists[artist] += 1
+
+        track_popularity = song["track"].get("popularity")
+        if track_popularity is not None:
+            popularity.append(track_popularity)
+
+    decades = sorted(decades.items(), key=lambda x: x[1], reverse=True)[:5]
+    top_artists = sorted(artists.items(), key=lambda x: x[1], reverse=True)[:5]
+    return decades, top_artists, round(sum(popularity) / len(popularity))
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        result = function(*args)
+    return (time.perf_counter() - start) / REPEAT * 1000, result
+
+
+if __name__ == "__main__":
+    for size in [1000, 10000]:
+        songs = playlist_items(size)
+        tracks = parse_items(songs)
+        legacy, legacy_result = timed(legacy_analyze, songs)
+        engine, stats = timed(analytics.analyze, tracks)
+        build, table = timed(analytics.build_table, tracks)
+
+        assert legacy_result[0] == stats["decades"] and legacy_result[2] == stats["popularity"]
+        print(f"{size:>6} tracks  legacy loop {legacy:7.2f} ms  analytics {engine:7.2f} ms "
+              f"(table build {build:.2f} ms, vectorized stats {engine - build:.2f} ms)")
@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "toolify"))
+
+import stub_spotify
+
+PLAYLISTS = int(os.getenv("BENCH_PLAYLISTS", 5000))
+PASSES = int(os.getenv("BENCH_PASSES", 3))
+
+stub_spotify.settings["playlists"] = PLAYLISTS
+stub, base_url = stub_spotify.start()
+directory = tempfile.mkdtemp()
+os.environ.update({
+    "CLIENT_ID": "bench",
+    "CLIENT_SECRET": "bench",
+    "SECRET_KEY": "bench",
+    "SPOTIFY_STATE": "bench",
+    "SPOTIFY_API_URL": f"{base_url}/v1",
+    "SPOTIFY_ACCOUNTS_URL": base_url,
+    "SESSION_DB": os.path.join(directory, "sessions.db"),
+    "CACHE_DB": os.path.join(directory, "cache.db"),
+    "METRICS_ENABLED": "0",
+    # The index stays fresh for the whole run so only rendering is measured
+    "PLAYLIST_INDEX_FRESH": "3600"
+})
+
+from app import app
+import helpers
+
+LINK = '<li class="page-item"><a class="page-link" href="/backup?page={0}">{0}</a></li>\n'
+
+
+def views(client, pages, **parameters):
+    elapsed = 0.0
+    size = 0
+    for page in pages:
+        headers = {}
+        if "etag" in parameters:
+            headers["If-None-Match"] = client.get("/backup", query_string={"page": page, "partial": "1"}).headers["ETag"]
+        start = time.perf_counter()
+        response = client.get("/backup", query_string={"page": page, **{name: value for name, value in parameters.items() if name != "etag"}}, headers=headers)
+        elapsed += time.perf_counter() - start
+        size += len(response.data)
+        assert response.status_code in [200, 304]
+    return elapsed / len(pages), size / len(pages)
+
+
+def report(label, result):
+    print(f"  {label:<34} {result[0] * 1000:7.2f} ms  {result[1] / 1024:7.1f} KiB")
+
+
+if __name__ == "__main__":
+    client = app.test_client()
+    client.get("/callback", query_string={"code": "bench", "state": "bench"})
+    client.get("/backup")
+    pages = list(range(1, -(-PLAYLISTS // 50) + 1))
+    print(f"{PLAYLISTS} playlists, {len(pages)} pages, every page viewed once per pass")
+
+    helpers.backup_page_cache.entries.clear()
+    report("full page, fragment cache cold", views(client, pages))
+    report("full page, fragment cache warm", views(client, pages * PASSES))
+    report("partial rows", views(client, pages * PASSES, partial="1"))
+    report("partial rows, If-None-Match", views(client, pages * PASSES, partial="1", etag=True))
+    report("json rows", views(client, pages * PASSES, format="json"))
+    print(f"  page links: {len(''.join(LINK.format(page) for page in pages)) / 1024:.1f} KiB for every page, {len(''.join(LINK.format(page) for page in helpers.page_window(50, len(pages)) if page)) / 1024:.1f} KiB windowed")
+    stub.shutdown()
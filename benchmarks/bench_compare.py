@@ -0,0 +1,84 @@
+import os
+import random
+import sys
+import time
+import tracemalloc
+from itertools import combinations
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "toolify"))
+
+import compare
+from fixtures import playlist_items
+from track_records import parse_items
+
+PLAYLISTS = int(os.getenv("BENCH_PLAYLISTS", 300))
+LIBRARY = int(os.getenv("BENCH_LIBRARY", 30000))
+MEAN_LENGTH = int(os.getenv("BENCH_MEAN_LENGTH", 150))
+NAIVE_LIMIT = int(os.getenv("BENCH_NAIVE_LIMIT", 300))
+
+
+def library_playlists(seed=0):
+    # Playlists draw from one shared pool with a popularity skew, so a realistic share of tracks repeat across them
+    rng = random.Random(seed)
+    pool = parse_items(playlist_items(LIBRARY, seed))
+    weights = [1 / (rank + 1) ** 0.6 for rank in range(LIBRARY)]
+    playlists = []
+    for i in range(PLAYLISTS):
+        length = max(1, int(rng.expovariate(1 / MEAN_LENGTH)))
+        playlists.append(({"id": f"{i:022d}", "name": f"Playlist {i}"}, rng.choices(pool, weights, k=length)))
+    return playlists
+
+
+def naive_compare(playlists):
+    # Python sets compared pair by pair, the straightforward version of compare.compare
+    track_sets = [set(track.uri for track in tracks) for _, tracks in playlists]
+    artist_sets = [set(artist for track in tracks for artist in track.artist_ids) for _, tracks in playlists]
+    pairs = []
+    for first, second in combinations(range(len(playlists)), 2):
+        shared = len(track_sets[first] & track_sets[second])
+        union = len(track_sets[first] | track_sets[second])
+        pairs.append((shared / union if union else 0.0, shared, len(artist_sets[first] & artist_sets[second]), first, second))
+    pairs.sort(key=lambda pair: -pair[0])
+
+    owners = {}
+    for index, uris in enumerate(track_sets):
+        for uri in uris:
+            owners.setdefault(uri, []).append(index)
+    return pairs[:50], sum(1 for indices in owners.values() if len(indices) > 1)
+
+
+def measure(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+
+    # Traced separately, tracemalloc slows every allocation down several times over
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+if __name__ == "__main__":
+    playlists = library_playlists()
+    tracks = sum(len(entry[1]) for entry in playlists)
+    print(f"{PLAYLISTS} playlists, {tracks} playlist tracks drawn from {LIBRARY}")
+
+    elapsed, peak, result = measure(compare.compare, playlists, 50, 500)
+    print(f"  compare.compare  {elapsed * 1000:8.1f} ms  peak {peak / 1024 / 1024:6.1f} MiB  {result['unique_tracks']} unique tracks, {result['duplicate_tracks']} duplicated")
+
+    library = compare.build_sets(playlists)
+    for label, function, argument in [("build_sets", compare.build_sets, playlists),
+                                      ("track overlap", compare.overlap_matrix, library["track_sets"]),
+                                      ("artist overlap", compare.overlap_matrix, library["artist_sets"]),
+                                      ("duplicates", compare.duplicates, library)]:
+        start = time.perf_counter()
+        function(argument) if label != "duplicates" else function(argument, 500)
+        print(f"    {label:<15} {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+    if PLAYLISTS <= NAIVE_LIMIT:
+        elapsed, peak, (pairs, duplicated) = measure(naive_compare, playlists)
+        assert duplicated == result["duplicate_tracks"]
+        assert [round(pair[0], 3) for pair in pairs] == [pair["jaccard"] for pair in result["pairs"]]
+        print(f"  pairwise sets    {elapsed * 1000:8.1f} ms  peak {peak / 1024 / 1024:6.1f} MiB")
@@ -0,0 +1,35 @@
+import os
+import sys
+import time
+
+import requests
+
+import stub_spotify
+
+server, base_url = stub_spotify.start()
+
+os.environ.setdefault("CLIENT_ID", "bench")
+os.environ.setdefault("CLIENT_SECRET", "bench")
+os.environ["SPOTIFY_API_URL"] = f"{base_url}/v1"
+os.environ["SPOTIFY_ACCOUNTS_URL"] = base_url
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "toolify"))
+
+import spotify
+
+CALLS = int(os.getenv("BENCH_CALLS", 2000))
+
+
+def run(label, get):
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        get(f"{base_url}/v1/me").json()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<24} {CALLS} calls  {elapsed:.3f}s  {elapsed / CALLS * 1000:.3f} ms/call")
+    return elapsed
+
+
+if __name__ == "__main__":
+    fresh = run("requests.get (no pool)", requests.get)
+    pooled = run("spotify.get (pooled)", spotify.get)
+    print(f"speedup: {fresh / pooled:.1f}x")
+    server.shutdown()
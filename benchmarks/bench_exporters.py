@@ -0,0 +1,37 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "toolify"))
+os.environ.setdefault("CLIENT_ID", "bench")
+os.environ.setdefault("CLIENT_SECRET", "bench")
+
+from exporters import exporters
+from fixtures import playlist_items
+from track_records import parse_items
+
+TRACKS = int(os.getenv("BENCH_TRACKS", 10000))
+REPEAT = int(os.getenv("BENCH_REPEAT", 5))
+
+
+def export(name, pages):
+    size = 0
+    largest_chunk = 0
+    for chunk in exporters[name]["write"](iter(pages)):
+        length = len(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+        size += length
+        largest_chunk = max(largest_chunk, length)
+    return size, largest_chunk
+
+
+if __name__ == "__main__":
+    items = parse_items(playlist_items(TRACKS))
+    pages = [items[i:i + 50] for i in range(0, len(items), 50)]
+
+    print(f"{TRACKS} tracks")
+    for name in exporters:
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            size, largest_chunk = export(name, pages)
+        elapsed = (time.perf_counter() - start) / REPEAT
+        print(f"{name:<8} {size / 1024:9.0f} KiB  {TRACKS / elapsed:9.0f} rows/s  largest chunk {largest_chunk / 1024:6.0f} KiB")
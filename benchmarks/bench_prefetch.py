@@ -0,0 +1,61 @@
+import asyncio
+import os
+import time
+
+import httpx
+
+from bench_routes import app_env, free_port, server_command, start_stub, wait_for
+import subprocess
+
+LATENCY = float(os.getenv("BENCH_LATENCY", 0.1))
+PLAYLISTS = int(os.getenv("BENCH_PLAYLISTS", 400))
+USERS = int(os.getenv("BENCH_USERS", 10))
+# How long a user spends on the landing page before opening /backup
+THINK = float(os.getenv("BENCH_THINK", 2.0))
+SERVERS = os.getenv("BENCH_SERVERS", "sync,async").split(",")
+
+
+def metric_lines(text, prefix):
+    return [line for line in text.splitlines() if line.startswith(prefix)]
+
+
+async def first_visits(base_url):
+    latencies = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        for user in range(USERS):
+            client.cookies.clear()
+            await client.get("/callback", params={"code": f"prefetch{user}", "state": "bench"})
+            await asyncio.sleep(THINK)
+            start = time.perf_counter()
+            response = await client.get("/backup")
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200
+        exposition = (await client.get("/metrics")).text
+    return sorted(latencies), exposition
+
+
+def run(server, enabled, env):
+    port = free_port()
+    process = wait_for(subprocess.Popen(server_command(server, port), cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "toolify"),
+                                        env={**env, "PREFETCH_ENABLED": "1" if enabled else "0"}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL), port)
+    try:
+        latencies, exposition = asyncio.run(first_visits(f"http://127.0.0.1:{port}"))
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(f"  {server:<5} prefetch {'on ' if enabled else 'off'}  first /backup p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms  max {latencies[-1] * 1000:7.1f} ms")
+    for line in metric_lines(exposition, "toolify_prefetch_runs_total") + metric_lines(exposition, "toolify_prefetch_first_page_seconds_sum") + metric_lines(exposition, "toolify_prefetch_first_page_seconds_count"):
+        print(f"      {line}")
+
+
+if __name__ == "__main__":
+    stub, stub_port = start_stub({"STUB_LATENCY": str(LATENCY), "STUB_PLAYLISTS": str(PLAYLISTS)})
+    env = app_env(stub_port)
+    print(f"{USERS} fresh logins with {PLAYLISTS} playlists each, {THINK:.1f} s before /backup, {LATENCY * 1000:.0f} ms stub latency")
+    try:
+        for server in SERVERS:
+            for enabled in [False, True]:
+                run(server, enabled, env)
+    finally:
+        stub.terminate()
@@ -0,0 +1,40 @@
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import stub_spotify
+
+server, base_url = stub_spotify.start()
+
+os.environ.setdefault("CLIENT_ID", "bench")
+os.environ.setdefault("CLIENT_SECRET", "bench")
+os.environ["SPOTIFY_API_URL"] = f"{base_url}/v1"
+os.environ["SPOTIFY_ACCOUNTS_URL"] = base_url
+os.environ.setdefault("RATE_LIMIT_JITTER", "0.05")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "toolify"))
+
+import spotify
+
+CALLS = int(os.getenv("BENCH_CALLS", 500))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", 16))
+
+stub_spotify.settings["throttle_every"] = int(os.getenv("BENCH_THROTTLE_EVERY", 50))
+stub_spotify.settings["retry_after"] = int(os.getenv("BENCH_RETRY_AFTER", 1))
+
+
+def call(_):
+    return spotify.get(f"{base_url}/v1/me").status_code
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        statuses = list(executor.map(call, range(CALLS)))
+    elapsed = time.perf_counter() - start
+
+    failed = sum(1 for status in statuses if status != 200)
+    print(f"{CALLS} calls at concurrency {CONCURRENCY} in {elapsed:.2f}s ({CALLS / elapsed:.0f} calls/s)")
+    print(f"stub sent {stub_spotify.counter['throttled']} x 429, failed requests: {failed}")
+    print(f"scheduler: {spotify.scheduler.stats()}")
+    server.shutdown()
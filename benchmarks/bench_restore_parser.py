@@ -0,0 +1,65 @@
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import StringIO
+from re import search
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "toolify"))
+os.environ.setdefault("CLIENT_ID", "bench")
+os.environ.setdefault("CLIENT_SECRET", "bench")
+
+import restore_parser
+
+ROWS = int(os.getenv("BENCH_ROWS", 100000))
+
+
+def write_fixture(path, rows):
+    rng = random.Random(0)
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Name", "Added at", "url", "spotify_id", "Album"])
+        for i in range(rows):
+            track_id = f"{rng.randrange(rows * 9 // 10):022d}"
+            writer.writerow([f"Track {i}", "2024-01-01T00:00:00Z", f"https://open.spotify.com/track/{track_id}", f"spotify:track:{track_id}", f"Album {i // 10}"])
+
+
+def legacy_parse(path, column):
+    with open(path, "rb") as file:
+        stream = StringIO(file.read().decode("UTF8"), newline=None)
+    expression = r"(?:track[/:])([A-Za-z0-9]{22})"
+    tracks = []
+    for row in csv.DictReader(stream):
+        track_id = search(expression, row.get(column))
+        if track_id:
+            tracks.append(track_id.group(1))
+    return tracks
+
+
+def streaming_parse(path, column):
+    return list(restore_parser.parse_track_ids(path, column))
+
+
+def measure(label, function, path, column):
+    start = time.perf_counter()
+    tracks = function(path, column)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    function(path, column)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"  {label:<28} {elapsed * 1000:8.1f} ms  peak {peak / 1024 / 1024:6.1f} MiB  {len(tracks)} ids")
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "restore.csv")
+        write_fixture(path, ROWS)
+        print(f"{ROWS} rows, {os.path.getsize(path) / 1024 / 1024:.1f} MiB")
+        for column in ["spotify_id", "url"]:
+            print(f"column {column}")
+            measure("legacy (read + re.search)", legacy_parse, path, column)
+            measure("restore_parser (streaming)", streaming_parse, path, column)
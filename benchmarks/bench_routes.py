@@ -0,0 +1,269 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from math import ceil
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+TOOLIFY = os.path.join(BENCHMARKS, "..", "toolify")
+
+LATENCY = float(os.getenv("BENCH_LATENCY", 0.1))
+TRACKS = int(os.getenv("BENCH_TRACKS", 200))
+PLAYLISTS = int(os.getenv("BENCH_PLAYLISTS", 120))
+RESTORE_TRACKS = int(os.getenv("BENCH_RESTORE_TRACKS", 200))
+REQUESTS = int(os.getenv("BENCH_REQUESTS", 100))
+THREADS = int(os.getenv("BENCH_THREADS", 8))
+CONCURRENCY = [int(level) for level in os.getenv("BENCH_CONCURRENCY", "1,10,50").split(",")]
+ROUTES = os.getenv("BENCH_ROUTES", "/backup,/download,/download-csv,/analyzed,/restore").split(",")
+SERVERS = os.getenv("BENCH_SERVERS", "sync,async").split(",")
+# Results can be saved and compared against a later run to catch regressions before deploy
+OUTPUT = os.getenv("BENCH_OUTPUT")
+BASELINE = os.getenv("BENCH_BASELINE")
+TOLERANCE = float(os.getenv("BENCH_TOLERANCE", 0.2))
+
+RESTORE_CSV = "url,ISRC\n" + "".join(f"https://open.spotify.com/track/{i:022d},USRC1{i:07d}\n" for i in range(RESTORE_TRACKS))
+
+
+def playlist_url(number):
+    return f"https://open.spotify.com/playlist/{number:022d}"
+
+
+async def backup(client, number):
+    response = await client.get("/backup", params={"page": number % ceil(PLAYLISTS / 50) + 1})
+    return response.status_code == 200
+
+
+async def download(client, number):
+    response = await client.get("/download", params={"playlist": f"{number:022d}"})
+    return response.status_code == 200
+
+
+async def download_csv(client, number):
+    response = await client.post("/download-csv", data={"playlist": playlist_url(number)})
+    return response.status_code == 200
+
+
+async def analyzed(client, number):
+    response = await client.get("/analyzed", params={"playlist": playlist_url(number)})
+    return response.status_code == 200
+
+
+async def restore(client, number):
+    # A restore only counts as done once its background job has finished
+    response = await client.post("/restore", files={"file": ("backup.csv", RESTORE_CSV, "text/csv")})
+    job_id = parse_qs(urlsplit(response.headers.get("location", "")).query).get("job")
+    if not job_id:
+        return False
+    while True:
+        job = (await client.get(f"/jobs/{job_id[0]}")).json()
+        if job["status"] in ["done", "failed"]:
+            return job["status"] == "done"
+        await asyncio.sleep(0.05)
+
+
+REQUESTS_BY_ROUTE = {
+    "/backup": backup,
+    "/download": download,
+    "/download-csv": download_csv,
+    "/analyzed": analyzed,
+    "/restore": restore
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(process, port):
+    for _ in range(100):
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{process.args} did not start")
+
+
+def start_stub(environ):
+    port = free_port()
+    # STUB_* variables already set, e.g. STUB_THROTTLE_EVERY or STUB_ERROR_EVERY, pass through and take precedence
+    stub_env = {**environ, **os.environ, "STUB_PORT": str(port)}
+    return wait_for(subprocess.Popen([sys.executable, "stub_spotify.py"], cwd=BENCHMARKS, stdout=subprocess.DEVNULL, env=stub_env), port), port
+
+
+def app_env(stub_port):
+    directory = tempfile.mkdtemp()
+    return {
+        **os.environ,
+        "CLIENT_ID": "bench",
+        "CLIENT_SECRET": "bench",
+        "SECRET_KEY": "bench",
+        "SPOTIFY_STATE": "bench",
+        "SPOTIFY_API_URL": f"http://127.0.0.1:{stub_port}/v1",
+        "SPOTIFY_ACCOUNTS_URL": f"http://127.0.0.1:{stub_port}",
+        "SESSION_DB": os.path.join(directory, "sessions.db"),
+        "CACHE_DB": os.path.join(directory, "cache.db"),
+        "JOBS_DB": os.path.join(directory, "jobs.db"),
+        "BACKUP_INDEX_DB": os.path.join(directory, "backup_index.db"),
+        "UPLOAD_DIR": os.path.join(directory, "uploads"),
+        "BACKUP_DIR": os.path.join(directory, "backups")
+    }
+
+
+def server_command(server, port):
+    if server == "sync":
+        return [sys.executable, "-m", "gunicorn", "-w", "1", "-k", "gthread", "--threads", str(THREADS), "-b", f"127.0.0.1:{port}", "app:app"]
+    return [sys.executable, "-m", "uvicorn", "asgi:application", "--port", str(port), "--log-level", "warning", "--no-access-log"]
+
+
+def server_pid(process):
+    # gunicorn serves from a forked worker, uvicorn from the process itself
+    children = subprocess.run(["pgrep", "-P", str(process.pid)], capture_output=True, text=True).stdout.split()
+    return int(children[0]) if children else process.pid
+
+
+def memory(pid, field):
+    with open(f"/proc/{pid}/status") as file:
+        for line in file:
+            if line.startswith(field):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def reset_peak(pid):
+    # Writing 5 to clear_refs resets VmHWM so each run reports its own peak
+    with open(f"/proc/{pid}/clear_refs", "w") as file:
+        file.write("5")
+
+
+async def outbound_calls(base_url):
+    # A fresh connection, a worker's may have sat idle past the server's keep-alive
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        response = await client.get("/metrics")
+    return sum(float(line.rsplit(" ", 1)[1]) for line in response.text.splitlines() if line.startswith("toolify_spotify_requests_total{"))
+
+
+async def login(base_url, index):
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        await client.get("/callback", params={"code": f"bench{index}", "state": "bench"})
+        return client.cookies
+
+
+async def load(base_url, route, concurrency, total):
+    send = REQUESTS_BY_ROUTE[route]
+    numbers = iter(range(total))
+    latencies = []
+    failures = 0
+
+    # Each worker is its own logged-in user; only the session cookie is kept so no connection sits idle past the server's keep-alive
+    clients = [httpx.AsyncClient(base_url=base_url, timeout=300, cookies=await login(base_url, index)) for index in range(concurrency)]
+    try:
+        calls = await outbound_calls(base_url)
+
+        async def worker(client):
+            nonlocal failures
+            for number in numbers:
+                start = time.perf_counter()
+                try:
+                    ok = await send(client, number)
+                except (httpx.HTTPError, ValueError):
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+                failures += not ok
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for client in clients))
+        elapsed = time.perf_counter() - start
+        calls = await outbound_calls(base_url) - calls
+    finally:
+        for client in clients:
+            await client.aclose()
+
+    latencies.sort()
+    return {
+        "throughput": total / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "calls": calls / total,
+        "failures": failures
+    }
+
+
+def run(server, port, env):
+    process = wait_for(subprocess.Popen(server_command(server, port), cwd=TOOLIFY, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL), port)
+    results = []
+    try:
+        pid = server_pid(process)
+        base_url = f"http://127.0.0.1:{port}"
+        asyncio.run(load(base_url, "/download-csv", 2, 10))
+
+        print(f"{server}: baseline RSS {memory(pid, 'VmRSS') / 1024 / 1024:.1f} MiB")
+        for route in ROUTES:
+            for concurrency in CONCURRENCY:
+                reset_peak(pid)
+                result = asyncio.run(load(base_url, route, concurrency, max(REQUESTS, concurrency * 2)))
+                result.update(server=server, route=route, concurrency=concurrency, peak_rss=memory(pid, "VmHWM"))
+                results.append(result)
+                print(f"  {route:<14} c={concurrency:<4} {result['throughput']:7.1f} req/s  p50 {result['p50'] * 1000:8.1f} ms  p99 {result['p99'] * 1000:8.1f} ms  "
+                      f"{result['calls']:5.1f} calls/req  peak RSS {result['peak_rss'] / 1024 / 1024:6.1f} MiB  failures {result['failures']}")
+    finally:
+        process.terminate()
+        process.wait()
+    return results
+
+
+def regressions(results, baseline):
+    previous = {(result["server"], result["route"], result["concurrency"]): result for result in baseline}
+    found = []
+    for result in results:
+        before = previous.get((result["server"], result["route"], result["concurrency"]))
+        if before is None:
+            continue
+        name = f"{result['server']} {result['route']} c={result['concurrency']}"
+        if result["throughput"] < before["throughput"] * (1 - TOLERANCE):
+            found.append(f"{name}: throughput {before['throughput']:.1f} -> {result['throughput']:.1f} req/s")
+        if result["calls"] > before["calls"] * (1 + TOLERANCE):
+            found.append(f"{name}: outbound calls {before['calls']:.1f} -> {result['calls']:.1f} per request")
+        if result["peak_rss"] > before["peak_rss"] * (1 + TOLERANCE):
+            found.append(f"{name}: peak RSS {before['peak_rss'] / 1024 / 1024:.1f} -> {result['peak_rss'] / 1024 / 1024:.1f} MiB")
+        if result["failures"] > before["failures"]:
+            found.append(f"{name}: failures {before['failures']} -> {result['failures']}")
+    return found
+
+
+if __name__ == "__main__":
+    stub, stub_port = start_stub({"STUB_LATENCY": str(LATENCY), "STUB_TRACKS": str(TRACKS), "STUB_PLAYLISTS": str(PLAYLISTS)})
+    env = {
+        **app_env(stub_port),
+        # Every request should reach the stub rather than the playlist cache
+        "PLAYLIST_CACHE_MAX_TRACKS": "0"
+    }
+
+    print(f"{PLAYLISTS} playlists of {TRACKS} tracks, {RESTORE_TRACKS}-track restores, {LATENCY * 1000:.0f} ms stub latency")
+    results = []
+    try:
+        for server in SERVERS:
+            results.extend(run(server, free_port(), env))
+    finally:
+        stub.terminate()
+
+    if OUTPUT:
+        with open(OUTPUT, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if BASELINE:
+        with open(BASELINE) as file:
+            found = regressions(results, json.load(file))
+        for line in found:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if found else 0)
@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "toolify"))
+os.environ.setdefault("CLIENT_ID", "bench")
+os.environ.setdefault("CLIENT_SECRET", "bench")
+
+from flask import Flask, session
+from flask_session import Session
+
+import sessions
+
+USERS = int(os.getenv("BENCH_USERS", 200))
+REQUESTS = int(os.getenv("BENCH_REQUESTS", 5000))
+WRITE_EVERY = int(os.getenv("BENCH_WRITE_EVERY", 10))
+
+
+def create_app(backend, directory):
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "bench"
+    app.config["SESSION_PERMANENT"] = False
+
+    if backend == "filesystem":
+        app.config["SESSION_TYPE"] = "filesystem"
+        app.config["SESSION_FILE_DIR"] = os.path.join(directory, "flask_session")
+        Session(app)
+    elif backend == "memory":
+        app.session_interface = sessions.StoreSessionInterface(sessions.MemorySessionStore(USERS * 2))
+    else:
+        app.session_interface = sessions.StoreSessionInterface(sessions.SQLiteSessionStore(os.path.join(directory, "sessions.db"), 0))
+
+    @app.route("/login/<user>")
+    def login(user):
+        session["access_token"] = user * 8
+        session["refresh_token"] = user * 8
+        session["expiry"] = datetime.now()
+        session["user_id"] = user
+        return ""
+
+    @app.route("/view/<int:n>")
+    def view(n):
+        if n % WRITE_EVERY == 0:
+            session["expiry"] = datetime.now()
+        return session["access_token"][:1]
+
+    return app
+
+
+def run(backend):
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app(backend, directory)
+        clients = [app.test_client() for _ in range(USERS)]
+        for user, client in enumerate(clients):
+            client.get(f"/login/user{user}")
+
+        start = time.perf_counter()
+        for n in range(REQUESTS):
+            clients[n % USERS].get(f"/view/{n}")
+        elapsed = time.perf_counter() - start
+
+    print(f"{backend:<12} {REQUESTS} requests  {elapsed:.2f}s  {REQUESTS / elapsed:7.0f} req/s  {elapsed / REQUESTS * 1e6:6.0f} us/req")
+
+
+if __name__ == "__main__":
+    for backend in ["filesystem", "sqlite", "memory"]:
+        run(backend)
@@ -0,0 +1,112 @@
+import csv
+import json
+import os
+import sys
+import time
+import tracemalloc
+from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "toolify"))
+os.environ.setdefault("CLIENT_ID", "bench")
+os.environ.setdefault("CLIENT_SECRET", "bench")
+
+import analytics
+from exporters import FIELDNAMES, exporters, ms_to_min
+from fixtures import playlist_items
+from track_records import parse_items
+
+TRACKS = int(os.getenv("BENCH_TRACKS", 10000))
+PAGE_SIZE = 100
+
+
+def requested_fields(song):
+    # What Spotify returns for track_records.ITEM_FIELDS
+    track = song["track"]
+    return {
+        "added_at": song["added_at"],
+        "track": {
+            "name": track["name"],
+            "uri": track["uri"],
+            "duration_ms": track["duration_ms"],
+            "explicit": track["explicit"],
+            "popularity": track["popularity"],
+            "external_urls": {"spotify": track["external_urls"]["spotify"]},
+            "external_ids": {"isrc": track["external_ids"]["isrc"]},
+            "album": {"name": track["album"]["name"], "release_date": track["album"]["release_date"]},
+            "artists": [{"id": artist["id"], "name": artist["name"]} for artist in track["artists"]]
+        }
+    }
+
+
+def encode_pages(items):
+    return [json.dumps({"items": items[i:i + PAGE_SIZE], "total": len(items), "limit": PAGE_SIZE, "offset": i}).encode("utf-8") for i in range(0, len(items), PAGE_SIZE)]
+
+
+def legacy_track_row(song):
+    track = song["track"]
+    return {
+        "Name": track.get("name"),
+        "Added at": song.get("added_at"),
+        "url": track["external_urls"].get("spotify"),
+        "spotify_id": track.get("uri"),
+        "Album": track["album"].get("name"),
+        "Album Url": track["external_urls"].get("spotify"),
+        "Artist": ", ".join(a.get("name") for a in track.get("artists", [])),
+        "Duration": ms_to_min(track.get("duration_ms")),
+        "ISRC": track["external_ids"].get("isrc"),
+        "Explicit": track.get("explicit"),
+    }
+
+
+def legacy_decode(bodies):
+    return [json.loads(body)["items"] for body in bodies]
+
+
+def slim_decode(bodies):
+    return [parse_items(json.loads(body)["items"]) for body in bodies]
+
+
+def legacy_export(pages):
+    output = StringIO()
+    writer = csv.DictWriter(output, fieldnames=FIELDNAMES)
+    writer.writeheader()
+    for page in pages:
+        writer.writerows(legacy_track_row(song) for song in page if song.get("track"))
+    return len(output.getvalue())
+
+
+def slim_export(pages):
+    return sum(len(chunk) for chunk in exporters["csv"]["write"](iter(pages)))
+
+
+def retained(decode, bodies):
+    tracemalloc.start()
+    pages = decode(bodies)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del pages
+    return size
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def measure(label, bodies, decode, export):
+    decode_time, pages = timed(decode, bodies)
+    export_time, _ = timed(export, pages)
+    print(f"  {label:<26} {sum(map(len, bodies)) / 1024:8.0f} KiB  decode {decode_time * 1000:7.1f} ms  retained {retained(decode, bodies) / 1024 / 1024:6.1f} MiB  "
+          f"csv {TRACKS / export_time:8.0f} rows/s  end to end {TRACKS / (decode_time + export_time):8.0f} rows/s")
+    return pages
+
+
+if __name__ == "__main__":
+    items = playlist_items(TRACKS)
+    print(f"{TRACKS} tracks in {len(items) // PAGE_SIZE} pages")
+    measure("full items (legacy)", encode_pages(items), legacy_decode, legacy_export)
+    slim = measure("fields= + TrackRecord", encode_pages([requested_fields(song) for song in items]), slim_decode, slim_export)
+
+    analyze_time, stats = timed(analytics.analyze, [track for page in slim for track in page])
+    print(f"  analytics.analyze on records {analyze_time * 1000:.1f} ms, {stats['tracks']} tracks")
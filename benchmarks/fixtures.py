@@ -0,0 +1,32 @@
+import random
+
+
+def playlist_items(count, seed=0):
+    rng = random.Random(seed)
+    artists = [f"{i:022d}" for i in range(max(count // 8, 10))]
+    items = []
+    for i in range(count):
+        credited = rng.sample(artists, rng.randint(1, 3))
+        track_id = f"{i:022d}"
+        items.append({
+            "added_at": "2024-01-01T00:00:00Z",
+            "track": {
+                "id": track_id,
+                "name": f"Track {i}",
+                "uri": f"spotify:track:{track_id}",
+                "duration_ms": rng.randint(90000, 480000),
+                "explicit": rng.random() < 0.2,
+                "popularity": rng.randint(0, 100),
+                "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+                "external_ids": {"isrc": f"USRC1{i:07d}"},
+                "available_markets": ["US", "GB", "DE", "FR", "CA"],
+                "album": {
+                    "name": f"Album {i // 10}",
+                    "release_date": f"{rng.randint(1960, 2024)}-01-01",
+                    "images": [{"url": "https://i.scdn.co/image/stub", "height": 640, "width": 640}],
+                    "external_urls": {"spotify": f"https://open.spotify.com/album/{i // 10:022d}"}
+                },
+                "artists": [{"id": artist, "name": f"Artist {artist[-4:]}"} for artist in credited]
+            }
+        })
+    return items
@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from fixtures import playlist_items
+
+# Every setting can be overridden with STUB_<NAME> when the stub runs as its own process
+settings = {
+    "throttle_every": 0,
+    "retry_after": 1,
+    "error_every": 0,
+    "error_status": 503,
+    "error_methods": "GET",
+    "latency": 0.0,
+    "jitter": 0.0,
+    "seed": 0,
+    "tracks": 500,
+    "playlists": 20,
+    "page_size": 0
+}
+# Spotify's own maximum page size per listing, page_size lowers it further when set
+MAX_LIMITS = {"playlists": 50, "saved": 50, "tracks": 100}
+REASONS = {200: "OK", 201: "Created", 302: "Found", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+           500: "Internal Server Error", 502: "Bad Gateway", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+fixtures = {}
+bodies = {}
+created = {}
+counter = {"requests": 0, "throttled": 0, "errors": 0, "created": 0, "added": 0}
+rng = random.Random(settings["seed"])
+
+
+def json_response(status, data, headers=None):
+    return status, headers or {}, json.dumps(data).encode("utf-8")
+
+
+def error(status, message):
+    return json_response(status, {"error": {"status": status, "message": message}})
+
+
+def tracks():
+    # Every playlist shares one fixture so memory stays flat however many IDs a benchmark uses
+    count = settings["tracks"]
+    if count not in fixtures:
+        fixtures[count] = playlist_items(count)
+    return fixtures[count]
+
+
+def user_playlists():
+    key = ("playlists", settings["playlists"], settings["tracks"])
+    if key not in fixtures:
+        fixtures[key] = [{"id": f"{i:022d}", "name": f"Playlist {i}", "snapshot_id": "stub", "images": [{"url": "https://i.scdn.co/image/stub"}], "owner": {"id": "stub"}, "public": True, "external_urls": {"spotify": f"https://open.spotify.com/playlist/{i:022d}"}, "tracks": {"total": settings["tracks"]}} for i in range(settings["playlists"])]
+    return fixtures[key]
+
+
+def page(kind, items, query, request_headers):
+    limit = min(int(query.get("limit", 20)), settings["page_size"] or MAX_LIMITS[kind], MAX_LIMITS[kind])
+    offset = int(query.get("offset", 0))
+    # Encoded pages are reused so the stub's own CPU doesn't dominate what the benchmarks measure
+    key = (kind, len(items), offset, limit)
+    if key not in bodies:
+        body = json.dumps({"items": items[offset:offset + limit], "total": len(items), "limit": limit, "offset": offset}).encode("utf-8")
+        bodies[key] = body, '"' + hashlib.md5(body).hexdigest() + '"'
+
+    body, etag = bodies[key]
+    if request_headers.get("if-none-match") == etag:
+        return 304, {"ETag": etag}, b""
+    return 200, {"ETag": etag}, body
+
+
+def user_id(request_headers):
+    token = request_headers.get("authorization", "").removeprefix("Bearer ")
+    return token.removeprefix("token-") if token.startswith("token-") else "stub"
+
+
+def track_id(isrc):
+    # Fixture ISRCs are USRC1 followed by the track's index
+    index = isrc.removeprefix("USRC1")
+    return f"{int(index):022d}" if index.isdigit() else None
+
+
+def token(query):
+    if query.get("grant_type") == "authorization_code":
+        code = query.get("code", "stub")
+        return json_response(200, {"access_token": f"token-{code}", "refresh_token": f"refresh-{code}", "token_type": "Bearer", "expires_in": 3600})
+    if query.get("grant_type") == "refresh_token":
+        code = query.get("refresh_token", "refresh-stub").removeprefix("refresh-")
+        return json_response(200, {"access_token": f"token-{code}", "token_type": "Bearer", "expires_in": 3600})
+    return json_response(200, {"access_token": "token-server", "token_type": "Bearer", "expires_in": 3600})
+
+
+def injected(method):
+    counter["requests"] += 1
+    if settings["throttle_every"] and counter["requests"] % settings["throttle_every"] == 0:
+        counter["throttled"] += 1
+        status, headers, body = error(429, "API rate limit exceeded")
+        return 429, {"Retry-After": str(settings["retry_after"])}, body
+    if settings["error_every"] and method in settings["error_methods"].split(",") and counter["requests"] % settings["error_every"] == 0:
+        counter["errors"] += 1
+        return error(settings["error_status"], "Injected server error")
+    return None
+
+
+def api_get(segments, query, request_headers):
+    if segments == ["me"]:
+        user = user_id(request_headers)
+        return json_response(200, {"id": user, "display_name": f"User {user}", "country": "US"})
+    if segments == ["me", "playlists"]:
+        return page("playlists", user_playlists(), query, request_headers)
+    if segments == ["me", "tracks"]:
+        return page("saved", tracks(), query, request_headers)
+    if segments[:1] == ["playlists"] and len(segments) == 2:
+        total = created.get(segments[1], len(tracks()))
+        return json_response(200, {"id": segments[1], "name": f"Playlist {segments[1][-4:]}", "snapshot_id": "stub", "images": [{"url": "https://i.scdn.co/image/stub"}], "tracks": {"total": total}})
+    if segments[:1] == ["playlists"] and segments[2:] == ["tracks"]:
+        return page("tracks", tracks(), query, request_headers)
+    if segments == ["artists"]:
+        return json_response(200, {"artists": [{"id": artist_id, "name": f"Artist {artist_id[-4:]}", "genres": ["stub"], "popularity": 50, "images": [{"url": "https://i.scdn.co/image/stub"}], "external_urls": {"spotify": f"https://open.spotify.com/artist/{artist_id}"}} for artist_id in query.get("ids", "").split(",")]})
+    if segments == ["tracks"]:
+        return json_response(200, {"tracks": [{"id": requested, "uri": f"spotify:track:{requested}", "is_playable": True} for requested in query.get("ids", "").split(",")]})
+    if segments == ["search"]:
+        found = track_id(query.get("q", "").removeprefix("isrc:"))
+        return json_response(200, {"tracks": {"items": [{"id": found, "uri": f"spotify:track:{found}"}] if found else [], "total": int(bool(found))}})
+    return error(404, "Service not found")
+
+
+def api_post(segments, body):
+    if segments[:1] == ["users"] and segments[2:] == ["playlists"]:
+        counter["created"] += 1
+        playlist_id = f"c{counter['created']:021d}"
+        created[playlist_id] = 0
+        return json_response(201, {"id": playlist_id, "name": json.loads(body or b"{}").get("name"), "snapshot_id": "stub"})
+    if segments[:1] == ["playlists"] and segments[2:] == ["tracks"]:
+        uris = json.loads(body or b"{}").get("uris", [])
+        if len(uris) > 100:
+            return error(400, "You can add a maximum of 100 tracks per request.")
+        counter["added"] += len(uris)
+        if segments[1] in created:
+            created[segments[1]] += len(uris)
+        return json_response(201, {"snapshot_id": f"stub{counter['added']}"})
+    return error(404, "Service not found")
+
+
+async def respond(method, target, request_headers, body):
+    url = urlsplit(target)
+    query = {name: values[0] for name, values in parse_qs(url.query).items()}
+    segments = url.path.strip("/").split("/")
+
+    if url.path == "/authorize":
+        # Logs in straight away so the app's /login redirect round-trips without a browser
+        return 302, {"Location": query["redirect_uri"] + "?" + urlencode({"code": "stub", "state": query.get("state", "")})}, b""
+    if method == "POST" and url.path == "/api/token":
+        if request_headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+            query.update({name: values[0] for name, values in parse_qs(body.decode("utf-8")).items()})
+        return token(query)
+    if segments[0] != "v1":
+        return error(404, "Service not found")
+
+    failure = injected(method)
+    if failure:
+        return failure
+    latency = settings["latency"] + (rng.random() * settings["jitter"] if settings["jitter"] else 0)
+    if latency:
+        await asyncio.sleep(latency)
+
+    if method == "GET":
+        return api_get(segments[1:], query, request_headers)
+    if method == "POST":
+        return api_post(segments[1:], body)
+    return error(405, "Method not allowed")
+
+
+async def handle(reader, writer):
+    try:
+        while True:
+            head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+            method, target, version = head[0].split(" ", 2)
+            request_headers = {}
+            for line in head[1:]:
+                name, _, value = line.partition(":")
+                if name:
+                    request_headers[name.strip().lower()] = value.strip()
+            length = int(request_headers.get("content-length") or 0)
+            body = await reader.readexactly(length) if length else b""
+
+            status, headers, payload = await respond(method, target, request_headers, body)
+            lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}", f"Content-Length: {len(payload)}"]
+            if payload:
+                lines.append("Content-Type: application/json")
+            lines.extend(f"{name}: {value}" for name, value in headers.items())
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + payload)
+            await writer.drain()
+
+            if version == "HTTP/1.0" or request_headers.get("connection", "").lower() == "close":
+                break
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.CancelledError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+class StubServer:
+    # Serves from an event loop on a daemon thread so in-process benchmarks can share the stub's settings
+    def __init__(self, port):
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(asyncio.start_server(handle, "127.0.0.1", port, backlog=1024))
+        self.port = self.server.sockets[0].getsockname()[1]
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    async def stop(self):
+        self.server.close()
+        connections = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in connections:
+            task.cancel()
+        await asyncio.gather(*connections, return_exceptions=True)
+
+    def shutdown(self):
+        # The loop is stopped only once stop() has handed its result back, or the caller waits forever
+        asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def configure(environ):
+    for name, value in settings.items():
+        override = environ.get(f"STUB_{name.upper()}")
+        if override is not None:
+            settings[name] = type(value)(override)
+    rng.seed(settings["seed"])
+
+
+def start(port=0):
+    server = StubServer(port)
+    return server, f"http://127.0.0.1:{server.port}"
+
+
+if __name__ == "__main__":
+    configure(os.environ)
+    server, base_url = start(int(os.getenv("STUB_PORT", 0)))
+    print(base_url, flush=True)
+    threading.Event().wait()
@@ -0,0 +1,51 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(root, "benchmarks"))
+sys.path.insert(0, os.path.join(root, "toolify"))
+
+import stub_spotify
+
+# config reads the environment once on import, so the stub has to be listening before any test imports the app
+server, base_url = stub_spotify.start()
+data_dir = tempfile.mkdtemp()
+os.environ.update({
+    "CLIENT_ID": "test",
+    "CLIENT_SECRET": "test",
+    "SECRET_KEY": "test",
+    "SPOTIFY_API_URL": f"{base_url}/v1",
+    "SPOTIFY_ACCOUNTS_URL": base_url,
+    "SESSION_DB": os.path.join(data_dir, "sessions.db"),
+    "CACHE_DB": os.path.join(data_dir, "cache.db"),
+    "JOBS_DB": os.path.join(data_dir, "jobs.db"),
+    "BACKUP_INDEX_DB": os.path.join(data_dir, "backup_index.db"),
+    "UPLOAD_DIR": os.path.join(data_dir, "uploads"),
+    "BACKUP_DIR": os.path.join(data_dir, "backups")
+})
+
+import config
+
+
+@pytest.fixture(scope="session", autouse=True)
+def stub():
+    yield base_url
+    server.shutdown()
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+
+@pytest.fixture
+def throttle_next(monkeypatch):
+    monkeypatch.setitem(stub_spotify.settings, "throttle_every", 2)
+    monkeypatch.setattr(config, "RATE_LIMIT_JITTER", 0)
+
+    def throttle_next(retry_after):
+        # The stub answers every second request with a 429, so line the counter up for the next one
+        monkeypatch.setitem(stub_spotify.settings, "retry_after", retry_after)
+        stub_spotify.counter["requests"] = 1
+
+    return throttle_next
@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+import cache
+import metrics
+
+
+@pytest.fixture
+def sqlite_cache(tmp_path):
+    def sqlite_cache(max_entries=100, max_bytes=1 << 20):
+        return cache.SQLiteCache("test", max_entries, max_bytes, 60, path=os.path.join(tmp_path, "cache.db"))
+
+    return sqlite_cache
+
+
+def test_get_many_records_each_key(sqlite_cache):
+    entries = sqlite_cache()
+    entries.set_many({"a": 1, "b": 2})
+
+    request_metrics = metrics.start_request()
+    assert entries.get_many(["a", "b", "c"]) == {"a": 1, "b": 2}
+    assert (request_metrics.cache_hits, request_metrics.cache_misses) == (2, 1)
+
+
+def test_usage_follows_replaces_deletes_and_evictions(sqlite_cache):
+    entries = sqlite_cache(max_entries=3)
+    entries.set("a", "x" * 10)
+    entries.set("a", "x" * 20)
+    entries.set_many({"b": 1, "c": 2, "d": 3})
+    entries.delete("d")
+
+    count, size = entries.usage()
+    assert count == 2
+    assert entries.connect().execute("SELECT COUNT(*), SUM(size) FROM cache WHERE name = 'test'").fetchone() == (count, size)
+    assert entries.get("a") is None
+    assert entries.evictions == 1
+
+    # A second instance over the same file, like another worker process, starts from the rows already there
+    assert sqlite_cache().usage() == (count, size)
@@ -0,0 +1,30 @@
+import time
+
+import config
+import spotify
+
+
+def test_retries_after_retry_after(stub, throttle_next):
+    throttle_next(1)
+    retries = spotify.scheduler.stats()["retries"]
+
+    start = time.monotonic()
+    response = spotify.get(f"{stub}/v1/me")
+
+    assert response.status_code == 200
+    assert time.monotonic() - start >= 1
+    assert spotify.scheduler.stats()["retries"] == retries + 1
+
+
+def test_gives_up_when_retry_after_exceeds_max_wait(stub, throttle_next, monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_MAX_WAIT", 5)
+    throttle_next(60)
+    retries = spotify.scheduler.stats()["retries"]
+
+    start = time.monotonic()
+    response = spotify.get(f"{stub}/v1/me")
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "60"
+    assert time.monotonic() - start < 1
+    assert spotify.scheduler.stats()["retries"] == retries
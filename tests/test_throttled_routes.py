@@ -0,0 +1,46 @@
+import pytest
+
+import stub_spotify
+from app import app
+
+
+@pytest.fixture
+def client():
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["access_token"] = "token-throttled"
+        session["user_id"] = "throttled"
+    return client
+
+
+def test_throttled_index_keeps_session(client, throttle_next):
+    throttle_next(60)
+
+    response = client.get("/analyze-playlist")
+
+    assert response.status_code == 302
+    assert response.headers["Location"] == "/error"
+    with client.session_transaction() as session:
+        assert session["access_token"] == "token-throttled"
+    assert b"Spotify is busy, try again in 60 seconds." in client.get("/error").data
+
+
+def test_throttled_download_keeps_session(client, throttle_next):
+    throttle_next(60)
+
+    response = client.get("/download", query_string={"playlist": "saved"})
+
+    assert response.headers["Location"] == "/error"
+    with client.session_transaction() as session:
+        assert session["access_token"] == "token-throttled"
+
+
+def test_rejected_token_ends_session(client, monkeypatch):
+    monkeypatch.setitem(stub_spotify.settings, "error_every", 1)
+    monkeypatch.setitem(stub_spotify.settings, "error_status", 401)
+
+    response = client.get("/download", query_string={"playlist": "saved"})
+
+    assert response.headers["Location"] == "/error"
+    with client.session_transaction() as session:
+        assert "access_token" not in session
@@ -0,0 +1,90 @@
+import numpy as np
+
+DURATION_BUCKETS = [0, 120000, 180000, 240000, 300000, 420000]
+DURATION_LABELS = ["< 2 min", "2-3 min", "3-4 min", "4-5 min", "5-7 min", "7+ min"]
+
+
+def build_table(tracks):
+    years = []
+    popularity = []
+    duration = []
+    explicit = []
+    artist_index = {}
+    artist_codes = []
+    artist_track = []
+
+    for track in tracks:
+        release_date = track.release_date or ""
+        years.append(int(release_date[:4]) if release_date[:4].isdigit() else 0)
+        popularity.append(-1 if track.popularity is None else track.popularity)
+        duration.append(track.duration_ms or 0)
+        explicit.append(bool(track.explicit))
+
+        # Artist IDs are interned to integer codes so counting works on plain int arrays
+        position = len(years) - 1
+        for artist_id in track.artist_ids:
+            artist_codes.append(artist_index.setdefault(artist_id, len(artist_index)))
+            artist_track.append(position)
+
+    return {
+        "year": np.array(years, dtype=np.int16),
+        "popularity": np.array(popularity, dtype=np.int16),
+        "duration_ms": np.array(duration, dtype=np.int32),
+        "explicit": np.array(explicit, dtype=bool),
+        "artist_code": np.array(artist_codes, dtype=np.int32),
+        "artist_track": np.array(artist_track, dtype=np.int32),
+        "artist_ids": list(artist_index)
+    }
+
+
+def ranked_counts(values, limit=None):
+    if not len(values):
+        return []
+
+    # Sort by count, breaking ties by first appearance like the original dict-based counting
+    keys, first, counts = np.unique(values, return_index=True, return_counts=True)
+    order = np.lexsort((first, -counts))
+    if limit:
+        order = order[:limit]
+    return [(keys[i].item(), counts[i].item()) for i in order]
+
+
+def artist_counts(table, codes, limit=None):
+    return [(table["artist_ids"][code], count) for code, count in ranked_counts(codes, limit)]
+
+
+def first_artists(table):
+    artist_track = table["artist_track"]
+    first = np.ones(len(artist_track), dtype=bool)
+    first[1:] = artist_track[1:] != artist_track[:-1]
+    return table["artist_code"][first]
+
+
+def analyze(tracks):
+    table = build_table(tracks)
+
+    years = table["year"][table["year"] > 0]
+    decades = [(f"{decade}s", count) for decade, count in ranked_counts(years // 10 * 10, 5)]
+
+    popularity = table["popularity"][table["popularity"] >= 0]
+    if len(popularity):
+        percentiles = np.percentile(popularity, [25, 50, 75, 90]).round().astype(int).tolist()
+        average_popularity = round(float(popularity.mean()))
+    else:
+        percentiles = [0, 0, 0, 0]
+        average_popularity = 0
+
+    duration = table["duration_ms"][table["duration_ms"] > 0]
+    bucket_counts = np.bincount(np.searchsorted(DURATION_BUCKETS, duration, side="right") - 1, minlength=len(DURATION_LABELS))
+
+    return {
+        "tracks": len(table["year"]),
+        "decades": decades,
+        "top_artists": artist_counts(table, first_artists(table), 5),
+        "artist_counts": artist_counts(table, table["artist_code"]),
+        "popularity": average_popularity,
+        "popularity_percentiles": dict(zip(["p25", "p50", "p75", "p90"], percentiles)),
+        "average_duration_ms": round(float(duration.mean())) if len(duration) else 0,
+        "duration_distribution": list(zip(DURATION_LABELS, bucket_counts.tolist())),
+        "explicit_ratio": round(float(table["explicit"].mean()), 3) if len(table["explicit"]) else 0
+    }
@@ -1,24 +1,61 @@
-import csv
-import requests
+import os
 import urllib.parse
 from datetime import datetime, timedelta
-from io import StringIO
 from math import ceil
 from re import search
 from werkzeug.exceptions import RequestEntityTooLarge
-from flask import Flask, flash, get_flashed_messages, redirect, render_template, request, Response, session, url_for
+from flask import Flask, flash, g, get_flashed_messages, redirect, render_template, request, Response, send_file, session, url_for
 from flask_session import Session
 
-from helpers import refresh_token, ms_to_min, get_server_token, download_playlist
+from backup import backup_archive_path, backup_library
+from exporters import exporters
+from helpers import (refresh_token, ms_to_min, get_server_token, get_user_id, remember_job, start_prefetch, bounded_map,
+                     tracks_request, fetch_remaining_pages, iter_remaining_pages, cached_playlist_tracks, cache_playlist_tracks,
+                     cache_playlist_pages, download_playlist, get_artists, get_playlist_index, backup_page,
+                     playlist_details, library_playlists, compare_playlists)
+from restore import match_report_path, restore_playlist, upload_path
+import analytics
+import cache
 import config
+import jobs
+import metrics
+import restore_parser
+import sessions
+import spotify
 
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = config.SECRET_KEY
-app.config["SESSION_TYPE"] = "filesystem"
 app.config["SESSION_PERMANENT"] = False
 app.config['MAX_CONTENT_LENGTH'] = 8 * 1024 * 1024
-Session(app)
+
+if config.SESSION_BACKEND == "filesystem":
+    app.config["SESSION_TYPE"] = "filesystem"
+    Session(app)
+else:
+    app.session_interface = sessions.create_session_interface()
+
+
+@app.before_request
+def start_request_metrics():
+    if config.METRICS_ENABLED:
+        g.metrics = metrics.start_request()
+
+
+@app.after_request
+def finish_request_metrics(response):
+    request_metrics = g.pop("metrics", None)
+    if request_metrics is None:
+        return response
+
+    if config.SERVER_TIMING:
+        response.headers["Server-Timing"] = metrics.timing_header(request_metrics)
+
+    # Streamed bodies are still being produced here, so record once the response is closed
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    method = request.method
+    response.call_on_close(lambda: metrics.finish_request(route, method, response.status_code, request_metrics))
+    return response
 
 
 @app.route("/")
@@ -40,7 +77,37 @@ def page_not_found():
 
 @app.route("/error")
 def unexpected_error():
-    return render_template("error.html")
+    message = get_flashed_messages(category_filter="spotify_busy")
+    return render_template("error.html", message=message[0] if message else "")
+
+
+def busy_message(error):
+    return f"Spotify is busy, try again in {ceil(error.retry_after)} seconds."
+
+
+@app.errorhandler(spotify.SpotifyError)
+def spotify_failed(error):
+    # A throttled call keeps the user logged in, only a rejected token ends the session
+    if error.status_code == 429:
+        flash(busy_message(error), "spotify_busy")
+    elif error.status_code == 401:
+        session.clear()
+    return redirect("/error")
+
+
+@app.route("/cache-stats")
+def cache_stats():
+    return {name: cache.caches[name].stats() for name in cache.caches}
+
+
+@app.route("/rate-limit-stats")
+def rate_limit_stats():
+    return spotify.scheduler.stats()
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(cache.caches, spotify.scheduler.stats()), mimetype="text/plain; version=0.0.4")
 
 
 @app.errorhandler(RequestEntityTooLarge)
@@ -60,7 +127,7 @@ def login():
         "show_dialog": "true",
     }
 
-    AUTH_URL = "https://accounts.spotify.com/authorize?" + urllib.parse.urlencode(parameters)
+    AUTH_URL = f"{config.ACCOUNTS_URL}/authorize?" + urllib.parse.urlencode(parameters)
     return redirect(AUTH_URL)
 
 
@@ -77,7 +144,7 @@ def callback():
             "redirect_uri": config.REDIRECT_URI
         }
 
-        response = requests.post(config.TOKEN_URL, headers=headers, params=parameters)
+        response = spotify.post(config.TOKEN_URL, headers=headers, params=parameters)
         if response.status_code != 200:
             session.clear()
             return redirect("/error")
@@ -88,6 +155,11 @@ def callback():
             session["access_token"] = result["access_token"]
             session["refresh_token"] = result["refresh_token"]
             session["expiry"] = datetime.now() + timedelta(seconds=3600)
+            session.pop("user_id", None)
+            try:
+                start_prefetch(get_user_id({"Authorization": f"Bearer {result['access_token']}"}), result["access_token"])
+            except spotify.SpotifyError:
+                pass
             return redirect("/")
         else:
             flash("Authorization failed. Please login again.", "authorization_failed")
@@ -108,401 +180,440 @@ def backup():
     
     refresh_token()
     page_number = request.args.get("page", 1, type=int)
-    per_page = 50
 
-    parameters = {
-        "limit": per_page,
-        "offset": (page_number - 1) * per_page
-    }
     headers = {
         "Authorization": f"Bearer {session["access_token"]}"
     }
-    response = requests.get(config.USER_PLAYLISTS, params=parameters, headers=headers)
-    if response.status_code != 200:
-        session.clear()
-        return redirect("/error")
-    
-    response = response.json()
+    user_id = get_user_id(headers)
+    index = get_playlist_index(user_id, headers)
 
-    total_pages = ceil(response["total"] / per_page)
-    if page_number > total_pages:
+    total_pages = ceil(index["total"] / config.BACKUP_PAGE_SIZE)
+    if page_number < 1 or page_number > total_pages:
         return redirect("/not-found")
-    
-    if page_number == 1:
-        params = {
-            "limit": 1,
+
+    if request.args.get("format") == "json":
+        offset = (page_number - 1) * config.BACKUP_PAGE_SIZE
+        response = {
+            "page": page_number,
+            "total_pages": total_pages,
+            "total": index["total"],
+            "saved_total": index["saved_total"],
+            "items": [{
+                "id": playlist["id"],
+                "name": playlist.get("name"),
+                "public": playlist.get("public"),
+                "tracks": playlist["tracks"]["total"],
+                "image": playlist["images"][0]["url"] if playlist.get("images") else None,
+                "url": playlist["external_urls"]["spotify"]
+            } for playlist in index["items"][offset:offset + config.BACKUP_PAGE_SIZE] if playlist]
         }
-        saved_songs = requests.get(config.SAVED_SONGS, params=params, headers=headers)
-        if saved_songs.status_code != 200:
-                session.clear()
-                return redirect("/error")
-        
-        saved_songs = saved_songs.json()
-        return render_template("backup.html", response=response, page_number=page_number, total_pages=total_pages, saved_songs=saved_songs)
+        return conditional_response(lambda: response, index, page_number, "json")
 
+    # Page links fetch only the table and pagination, revalidated by ETag so an unchanged page comes back empty
+    if request.args.get("partial") == "1":
+        return conditional_response(lambda: backup_page(user_id, index, page_number, total_pages), index, page_number, "html")
+
+    return render_template("backup.html", fragment=backup_page(user_id, index, page_number, total_pages))
+
+
+def conditional_response(render, index, page_number, kind):
+    if not index.get("version"):
+        return render()
+
+    etag = f"{index['version']}-{page_number}-{kind}"
+    response = Response(status=304) if request.if_none_match.contains(etag) else app.make_response(render())
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@app.route("/backup-all", methods=["GET", "POST"])
+def backup_all():
+    if "access_token" not in session:
+        return render_template("backup-all.html", heading="To Backup your Playlists")
+
+    if request.method == "GET":
+        job_id = request.args.get("job")
+        if job_id not in session.get("jobs", []):
+            job_id = None
+        return render_template("backup-all.html", job_id=job_id)
+
+    refresh_token()
+
+    headers = {
+        "Authorization": f"Bearer {session['access_token']}"
+    }
+    user_id = get_user_id(headers)
+
+    mode = "incremental" if request.form.get("mode") == "incremental" else "full"
+    job_id = jobs.submit("backup", backup_library, session["access_token"], user_id, mode)
+    remember_job(job_id)
+    return redirect(f"/backup-all?job={job_id}")
+
+
+@app.route("/backup-all/<job_id>/download")
+def download_backup(job_id):
+    job = jobs.get_job(job_id)
+    if job_id not in session.get("jobs", []) or job is None or job["status"] != "done":
+        return redirect("/not-found")
+
+    path = backup_archive_path(job_id)
+    if not os.path.exists(path):
+        return redirect("/not-found")
+
+    return send_file(os.path.abspath(path), mimetype="application/zip", as_attachment=True, download_name=f"{datetime.fromtimestamp(job['updated']).strftime('%Y-%m-%d')}_spotify_backup.zip")
 
-    return render_template("backup.html", response=response, page_number=page_number, total_pages=total_pages)
-    
 
 @app.route("/download")
 def download():
     playlist_id = request.args.get("playlist")
+    export_format = request.args.get("format", "csv")
 
-    if not playlist_id:
+    if not playlist_id or export_format not in exporters:
         return redirect("/not-found")
     
     refresh_token()
 
-    result = []
-    
-    parameters = {
-        "market": "US",
-        "limit": 50,
-        "offset": 0
-    }
+    url, parameters = tracks_request(playlist_id)
     headers = {
         "Authorization": f"Bearer {session["access_token"]}"
     }
 
-    if playlist_id == "saved":
-        response = requests.get(config.SAVED_SONGS, params=parameters, headers=headers)
-    else:
-        response = requests.get(f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks", params=parameters, headers=headers)
-
+    response = spotify.get(url, params=parameters, headers=headers)
     if response.status_code != 200:
-            session.clear()
-            return redirect("/error")
-    
-    response = response.json()
+        return spotify_failed(spotify.response_error(response))
     
-    result.extend(response.get("items", []))
-
-    while (response["next"]):
-        response = requests.get(response["next"], headers=headers)
-        if response.status_code != 200:
-            session.clear()
-            return redirect("/error")
-    
-        response = response.json()
-        result.extend(response.get("items", []))
-
-    return download_playlist(result)
+    return download_playlist(iter_remaining_pages(url, headers, parameters, response.json()), export_format)
     
 
-@app.route("/restore", methods=["GET", "POST"])
-def restore():
-    if request.method == "GET":
-        message = get_flashed_messages(category_filter=["restore_error", "restore_success"])
-        message = message[0] if message else ""
-        return render_template("restore.html", heading="To restore Playlist from Backup", message=message)
-    
+def save_restore_upload():
     if "file" not in request.files:
         flash("Please provide a .csv file", "restore_error")
-        return redirect("/restore")
+        return None
 
     file = request.files["file"]
 
     if file.filename == '': 
         flash("No selected file", "restore_error")
-        return redirect("/restore")
+        return None
     
     if not file.filename.lower().endswith(".csv"):
         flash("Invalid file", "restore_error")
-        return redirect("/restore")
+        return None
     
     if file.mimetype not in ["text/csv", "application/vnd.ms-excel"]:
         flash("Uploaded file is not a valid CSV", "restore_error")
-        return redirect("/restore")
+        return None
     
+    job_id = jobs.create_job("restore")
+    path = upload_path(job_id)
+    os.makedirs(config.UPLOAD_DIR, exist_ok=True)
+    file.save(path)
+
     try:
-        stream = StringIO(file.stream.read().decode("UTF8"), newline=None)
-        csv_data = csv.DictReader(stream)
+        column, isrc_column = restore_parser.find_columns(path)
+        column = column or isrc_column
     except Exception:
+        column = None
         flash("Failed to read CSV file. Please make sure it's properly formatted.", "restore_error")
-        return redirect("/restore")
-    
-    fieldnames = csv_data.fieldnames
-    tracks = []
-    expression = r"(?:track[/:])([A-Za-z0-9]{22})"
-
-    if "url" in fieldnames:
-        for row in csv_data:
-            track_id = search(expression, row.get("url"))
-            if not track_id:
-                continue
-            tracks.append(track_id.group(1))
-    elif "spotify_id" in fieldnames:
-        for row in csv_data:
-            track_id = search(expression, row.get("spotify_id"))
-            if not track_id:
-                continue
-            tracks.append(track_id.group(1))
     else:
-        flash("Error. Make sure csv contains 'url' or 'spotify_id' column.", "restore_error")
-        return redirect("/restore")
-    
-    MAX_ROWS = 1000
-    if len(tracks) > MAX_ROWS:
-        flash(f"CSV contains more than {MAX_ROWS} tracks. Please upload a smaller list.", "restore_error")
-        return redirect("/restore")
-    if not tracks:
-        flash(f"CSV is empty.", "restore_error")
-        return redirect("/restore") 
-    
-    refresh_token()
+        if not column:
+            flash("Error. Make sure csv contains 'url', 'spotify_id' or 'ISRC' column.", "restore_error")
 
-    data = {
-        "name": f"Restored Playlist {datetime.now().strftime('%Y-%m-%d')}"
-    }
-    headers = {
-        "Authorization": f"Bearer {session["access_token"]}",
-        "Content-Type": "application/json"
-    }
+    if not column:
+        os.remove(path)
+        jobs.delete_job(job_id)
+        return None
 
-    response = requests.get("https://api.spotify.com/v1/me", headers=headers)
-    if response.status_code != 200:
-            session.clear()
-            return redirect("/error")
-    response = response.json()
-    user_id = response.get("id")
+    return job_id
 
-    create_playlist = requests.post(f"https://api.spotify.com/v1/users/{user_id}/playlists", headers=headers, json=data)
-    if create_playlist.status_code not in [200, 201]:
-        session.clear()
-        return redirect("/error")
-    
-    create_playlist = create_playlist.json()
-    playlist_id = create_playlist.get("id")
-
-    for i in range(0, len(tracks), 100):
-        chunk = tracks[i:i + 100]
-        uris = [f"spotify:track:{track_id}" for track_id in chunk]
-        track_uris = {
-            "uris": uris,
-        }
-        add_to_playlist = requests.post(f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks", headers=headers, json=track_uris)
-        if add_to_playlist.status_code not in [200, 201]:
-            flash(f"Failed to restore playlist. Please try again.", "restore_error")
-            return redirect("/restore")
-    
-    flash(f"Playlist Restored", "restore_success")
-    return redirect("/restore")
 
+def start_restore(job_id):
+    # The restore itself is a resumable background job, the request only hands it off
+    jobs.start(job_id, restore_playlist, session["access_token"])
+    remember_job(job_id)
+    return redirect(f"/restore?job={job_id}")
 
-@app.route("/download-csv", methods=["GET", "POST"])
-def download_csv():
+
+@app.route("/restore", methods=["GET", "POST"])
+def restore():
     if request.method == "GET":
-        message = get_flashed_messages(category_filter="download_error")
+        message = get_flashed_messages(category_filter=["restore_error", "restore_success"])
         message = message[0] if message else ""
-        return render_template("download-csv.html", message=message)
+        job_id = request.args.get("job")
+        if job_id not in session.get("jobs", []):
+            job_id = None
+        return render_template("restore.html", heading="To restore Playlist from Backup", message=message, job_id=job_id)
     
-    link = request.form.get("playlist")
+    job_id = save_restore_upload()
+    if job_id is None:
+        return redirect("/restore")
+
+    refresh_token()
+    return start_restore(job_id)
+
+
+@app.route("/restore/<job_id>/report")
+def restore_report(job_id):
+    path = match_report_path(job_id)
+    if job_id not in session.get("jobs", []) or not os.path.exists(path):
+        return redirect("/not-found")
+
+    return send_file(os.path.abspath(path), mimetype="text/csv", as_attachment=True, download_name="restore_report.csv")
+
+
+@app.route("/jobs/<job_id>/resume", methods=["POST"])
+def resume_job(job_id):
+    job = jobs.get_job(job_id)
+    if job_id not in session.get("jobs", []) or job is None:
+        return redirect("/not-found")
+
+    if not jobs.is_resumable(job) or not os.path.exists(upload_path(job_id)):
+        flash("This restore can no longer be resumed. Please upload the file again.", "restore_error")
+        return redirect("/restore")
+
+    refresh_token()
+
+    if not jobs.resume(job, restore_playlist, session["access_token"]):
+        flash("This restore is already running again.", "restore_error")
+    return redirect(f"/restore?job={job_id}")
 
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    if job_id not in session.get("jobs", []):
+        return {"error": "Job not found"}, 404
+
+    job = jobs.get_job(job_id)
+    if job is None:
+        return {"error": "Job not found"}, 404
+
+    job["resumable"] = jobs.is_resumable(job)
+    return job
+
+
+def playlist_link_id(link, category):
+    playlist_id = search(r"(?:playlist[/:])([A-Za-z0-9]{22})", link or "")
+    if not playlist_id:
+        if link:
+            flash("Invalid Spotify Playlist URL", category)
+        return None
+
+    return playlist_id.group(1)
+
+
+def playlist_available(response, category):
+    if response.status_code == 429:
+        flash(busy_message(spotify.response_error(response)), category)
+    elif response.status_code in [401, 403, 404]:
+        flash("Unable to access Playlist", category)
+    elif response.status_code != 200:
+        flash("Invalid Spotify Playlist URL", category)
+    return response.status_code == 200
+
+
+def download_link_id(link, export_format):
     if not link:
         flash("Please Provide a Spotify Playlist link.", "download_error")
-        return redirect("/download-csv")
+        return None
 
-    expression = r"(?:playlist[/:])([A-Za-z0-9]{22})"
+    if export_format not in exporters:
+        flash("Unsupported download format.", "download_error")
+        return None
 
-    playlist_id = search(expression, link)
+    return playlist_link_id(link, "download_error")
 
+
+@app.route("/download-csv", methods=["GET", "POST"])
+def download_csv():
+    if request.method == "GET":
+        message = get_flashed_messages(category_filter="download_error")
+        message = message[0] if message else ""
+        return render_template("download-csv.html", message=message, formats=exporters)
+    
+    export_format = request.form.get("format", "csv")
+    playlist_id = download_link_id(request.form.get("playlist"), export_format)
     if not playlist_id:
-        flash("Invalid Spotify Playlist URL", "download_error")
         return redirect("/download-csv")
-    
-    playlist_id = playlist_id.group(1)
 
-    get_server_token()
+    server_token = get_server_token()
+    if not server_token:
+        return redirect("/error")
 
-    songs = []    
-    parameters = {
-        "market": "US",
-        "limit": 50,
-        "offset": 0
-    }
+    url, parameters = tracks_request(playlist_id)
     headers = {
-        "Authorization": f"Bearer {session['server_access_token']}"
+        "Authorization": f"Bearer {server_token}"
     }
 
-    response = requests.get(f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks", params=parameters, headers=headers)
-    if response.status_code in [401, 403, 404]:
-        flash("Unable to access Playlist", "download_error")
+    playlist_details = spotify.get(f"{config.API_URL}/playlists/{playlist_id}", params={"market": "US", "fields": "snapshot_id"}, headers=headers)
+    if not playlist_available(playlist_details, "download_error"):
         return redirect("/download-csv")
-    elif response.status_code != 200:
-        flash("Invalid Spotify Playlist URL", "download_error")
+
+    snapshot_id = playlist_details.json().get("snapshot_id")
+    songs = cached_playlist_tracks(playlist_id, snapshot_id)
+    if songs is not None:
+        return download_playlist([songs], export_format)
+
+    response = spotify.get(url, params=parameters, headers=headers)
+    if not playlist_available(response, "download_error"):
         return redirect("/download-csv")
     
-    response = response.json()
+    return download_playlist(cache_playlist_pages(playlist_id, snapshot_id, iter_remaining_pages(url, headers, parameters, response.json())), export_format)
 
-    songs.extend(response.get("items", []))
-    while (response["next"]):
-        response = requests.get(response["next"], headers=headers)
-        if response.status_code != 200:
-            flash("Something went wrong. Please try again.", "download_error")
-            return redirect("/download-csv")
-    
-        response = response.json()
-        songs.extend(response.get("items", []))
 
-    return download_playlist(songs)
+def render_analyze(playlists=None):
+    message = get_flashed_messages(category_filter="analyze_error")
+    return render_template("analyze.html", playlists=playlists, message=message[0] if message else "")
 
 
 @app.route("/analyze-playlist")
 def analyze_playlist():
-    message = get_flashed_messages(category_filter="analyze_error")
-    message = message[0] if message else ""
-
     if "access_token" not in session:   
-        return render_template("analyze.html", message=message)
+        return render_analyze()
     
     refresh_token()
 
-    result = []
-    parameters = {
-        "limit": 50,
-        "offset": 0
-    }
     headers = {
         "Authorization": f"Bearer {session["access_token"]}"
     }
-    response = requests.get(config.USER_PLAYLISTS, params=parameters, headers=headers)
-    if response.status_code != 200:
-            session.clear()
-            return redirect("/error")
-    
-    response = response.json()
-    result.extend(response.get("items", []))
+    user_id = get_user_id(headers)
+    index = get_playlist_index(user_id, headers)
+    return render_analyze(index["items"])
 
-    while (response["next"]):
-        response = requests.get(response["next"], headers=headers)
-        if response.status_code != 200:
-            session.clear()
-            return redirect("/error")
-    
-        response = response.json()
-        result.extend(response.get("items", []))
-    
-    return render_template("analyze.html", playlists=result, message=message)
 
+def analyzable_length(total_songs):
+    if total_songs < 10:
+        flash("Playlist too short. Consider adding more songs.", "analyze_error")
+        return False
+    elif total_songs > 1000:
+        flash("Maximum length of Playlist allowed is 1000 tracks", "analyze_error")
+        return False
+    return True
 
-@app.route("/analyzed")
-def analyzed():
 
-    link = request.args.get("playlist")
+def analysis_failed(error):
+    flash(busy_message(error) if error.status_code == 429 else "Something went wrong. Please try again.", "analyze_error")
+    return redirect("/analyze-playlist")
 
-    if not link:
-         return redirect("/analyze-playlist")
 
-    expression = r"(?:playlist[/:])([A-Za-z0-9]{22})"
+def render_analysis(playlist_details, stats, artist_data):
+    return render_template("analyzed.html", playlist_cover=playlist_details["images"][0].get("url"), playlist_title=playlist_details.get("name"), artist_data=artist_data, decades=stats["decades"], popularity=stats["popularity"], stats=stats, average_duration=ms_to_min(stats["average_duration_ms"]))
 
-    playlist_id = search(expression, link)
 
+@app.route("/analyzed")
+def analyzed():
+    playlist_id = playlist_link_id(request.args.get("playlist"), "analyze_error")
     if not playlist_id:
-        flash("Invalid Spotify Playlist URL", "analyze_error")
         return redirect("/analyze-playlist")
-    
-    playlist_id = playlist_id.group(1)
 
-    get_server_token()
+    server_token = get_server_token()
+    if not server_token:
+        return redirect("/error")
 
-    songs = []    
-    parameters = {
-        "market": "US",
-        "limit": 50,
-        "offset": 0
-    }
+    url, parameters = tracks_request(playlist_id)
     headers = {
-        "Authorization": f"Bearer {session['server_access_token']}"
+        "Authorization": f"Bearer {server_token}"
     }
 
-    playlist_details = requests.get(f"https://api.spotify.com/v1/playlists/{playlist_id}", params={"market": "US"}, headers=headers)
-    if playlist_details.status_code in [401, 403, 404]:
-        flash("Unable to access Playlist", "analyze_error")
-        return redirect("/analyze-playlist")
-    if playlist_details.status_code != 200:
-        flash("Invalid Spotify Playlist URL", "analyze_error")
+    playlist_details = spotify.get(f"{config.API_URL}/playlists/{playlist_id}", params={"market": "US", "fields": "name,images,snapshot_id"}, headers=headers)
+    if not playlist_available(playlist_details, "analyze_error"):
         return redirect("/analyze-playlist")
     
     playlist_details = playlist_details.json()
-    playlist_cover = playlist_details["images"][0].get("url")
-    playlist_title = playlist_details.get("name")
-
-    response = requests.get(f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks", params=parameters, headers=headers)
-
-    if response.status_code in [401, 403, 404]:
-        flash("Unable to access Playlist", "analyze_error")
-        return redirect("/analyze-playlist")
-    elif response.status_code != 200:
-        flash("Invalid Spotify Playlist URL", "analyze_error")
-        return redirect("/analyze-playlist")
-    
-    response = response.json()
+    snapshot_id = playlist_details.get("snapshot_id")
 
-    total_songs = response["total"]
-    if total_songs < 10:
-        flash("Playlist too short. Consider adding more songs.", "analyze_error")
-        return redirect("/analyze-playlist")
-    elif total_songs > 1000:
-        flash("Maximum length of Playlist allowed is 1000 tracks", "analyze_error")
-        return redirect("/analyze-playlist")
-    
-    songs.extend(response.get("items", []))
-
-    while (response["next"]):
-        response = requests.get(response["next"], headers=headers)
-        if response.status_code != 200:
-            flash("Something went wrong. Please try again.", "analyze_error")
+    songs = cached_playlist_tracks(playlist_id, snapshot_id)
+    if songs is None:
+        response = spotify.get(url, params=parameters, headers=headers)
+        if not playlist_available(response, "analyze_error"):
             return redirect("/analyze-playlist")
-    
         response = response.json()
-        songs.extend(response.get("items", []))
 
-    year_rex = r"([0-9]{4})"
-    decades = {}
-    artists = {}
-    popularity = []
+    if not analyzable_length(len(songs) if songs is not None else response["total"]):
+        return redirect("/analyze-playlist")
     
-    for song in songs:
-        year = search(year_rex, song["track"]["album"].get("release_date"))
-        if year:
-            year = year.group(1)
-            decade = year[:3] + "0s"
-            if decade not in decades:
-                decades[decade] = 1
-            else:
-                decades[decade] += 1
-        
-        artist = song["track"].get("artists")
-        if artist:
-            artist = artist[0]["id"]
-            if artist not in artists:
-                artists[artist] = 1
-            else:
-                artists[artist] += 1
-
-        track_popularity = song["track"].get("popularity")
-        if track_popularity is not None:
-            popularity.append(track_popularity)
-
-
-    decades = sorted(decades.items(), key=lambda x: x[1], reverse=True)
-    if len(decades) > 5:
-        decades = decades[:5]
-
-    top_artists = sorted(artists.items(), key=lambda x: x[1], reverse=True)
-    if len(top_artists) > 5:
-        top_artists = top_artists[:5]
-
-    artist_ids = [i[0] for i in top_artists]
-    artist_ids = ",".join(artist_ids)
-
-    artist_data = requests.get(f"https://api.spotify.com/v1/artists?ids={artist_ids}", headers=headers)
-    if artist_data.status_code != 200:
-            session.clear()
+    if songs is None:
+        try:
+            songs = fetch_remaining_pages(url, headers, parameters, response)
+        except spotify.SpotifyError as error:
+            return analysis_failed(error)
+        cache_playlist_tracks(playlist_id, snapshot_id, songs)
+
+    stats = analytics.analyze(songs)
+    artist_ids = [i[0] for i in stats["top_artists"]]
+
+    artist_data = get_artists(artist_ids, headers)
+    return render_analysis(playlist_details, stats, artist_data)
+
+
+@app.route("/compare")
+def compare_view():
+    as_json = request.args.get("format") == "json"
+    links = request.args.getlist("playlist") + request.args.get("playlists", "").split()
+    compare_all = request.args.get("all") == "1"
+
+    def failed(message, status=400):
+        if as_json:
+            return {"error": message}, status
+        flash(message, "compare_error")
+        return redirect("/compare")
+
+    if not links and not compare_all:
+        if as_json:
+            return failed("Provide playlist links or all=1.")
+        message = get_flashed_messages(category_filter="compare_error")
+        return render_template("compare.html", message=message[0] if message else "")
+
+    if "access_token" in session:
+        refresh_token()
+        token = session["access_token"]
+    elif compare_all:
+        return failed("Please login to compare your playlists.", 401)
+    else:
+        token = get_server_token()
+        if not token:
             return redirect("/error")
-    artist_data = artist_data.json()
-    artist_data = artist_data.get("artists", [])
 
-    popularity = round(sum(popularity) / len(popularity))
+    headers = {
+        "Authorization": f"Bearer {token}"
+    }
+
+    if compare_all:
+        user_id = get_user_id(headers)
+        playlists = library_playlists(get_playlist_index(user_id, headers))
+    else:
+        expression = r"(?:playlist[/:])([A-Za-z0-9]{22})"
+        playlist_ids = []
+        for link in links:
+            playlist_id = search(expression, link)
+            if not playlist_id:
+                return failed(f"Invalid Spotify Playlist URL: {link}")
+            playlist_ids.append(playlist_id.group(1))
+        playlist_ids = list(dict.fromkeys(playlist_ids))
+        if len(playlist_ids) < 2:
+            return failed("Provide at least two different playlists to compare.")
+        if len(playlist_ids) > config.COMPARE_MAX_PLAYLISTS:
+            return failed(f"At most {config.COMPARE_MAX_PLAYLISTS} playlists can be compared at once.")
+
+        try:
+            playlists = list(bounded_map(lambda playlist_id: playlist_details(playlist_id, headers), playlist_ids, config.COMPARE_WORKERS))
+        except spotify.SpotifyError as error:
+            if error.status_code == 429:
+                return failed(busy_message(error), 429)
+            return failed("Unable to access one of the Playlists", 404)
+
+    if len(playlists) > config.COMPARE_MAX_PLAYLISTS:
+        return failed(f"At most {config.COMPARE_MAX_PLAYLISTS} playlists can be compared at once.")
+    if sum(playlist["total"] for playlist in playlists) > config.COMPARE_MAX_TRACKS:
+        return failed(f"At most {config.COMPARE_MAX_TRACKS} tracks can be compared at once.")
 
-    return render_template("analyzed.html", playlist_cover=playlist_cover, playlist_title=playlist_title, artist_data=artist_data, decades=decades, popularity=popularity)
\ No newline at end of file
+    try:
+        result = compare_playlists(playlists, headers)
+    except spotify.SpotifyError as error:
+        if error.status_code == 429:
+            return failed(busy_message(error), 429)
+        return failed("Something went wrong. Please try again.", 502)
+
+    if as_json:
+        return result
+    return render_template("compare.html", result=result)
@@ -0,0 +1,431 @@
+import asyncio
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from itertools import islice
+
+from flask import redirect, request, Response, session
+from flask.ctx import RequestContext
+
+from app import (app, spotify_failed, save_restore_upload, start_restore, playlist_link_id, playlist_available, download_link_id,
+                 render_analyze, analyzable_length, analysis_failed, render_analysis)
+from exporters import exporters
+from helpers import (token_expired, token_refresh_request, store_refreshed_token, cached_server_token, store_user_id,
+                     conditional_headers, conditional_page, cached_playlist_index, playlists_request, saved_songs_request,
+                     playlist_index_offsets, store_playlist_index, cached_artists, artist_batches, store_artists, tracks_request,
+                     remaining_offsets, page_items, cached_playlist_tracks, cache_playlist_tracks, cache_playlist_pages, download_response)
+import analytics
+import aspotify
+import config
+import helpers
+import metrics
+import prefetch
+import spotify
+from track_records import parse_items
+
+# Run with an ASGI server, e.g. `uvicorn asgi:application`. Routes below are served natively on the
+# event loop, every other request is handed to the Flask app in a worker thread. The routes share their
+# validation and rendering steps with app.py and only make their Spotify calls differently.
+routes = {}
+
+
+def route(path, methods=["GET"]):
+    def register(view):
+        routes[path] = (methods, view)
+        return view
+    return register
+
+
+class StreamingResponse(Response):
+    def __init__(self, chunks, **kwargs):
+        super().__init__(iter(()), **kwargs)
+        self.chunks = chunks
+
+
+class PageFeed:
+    # Hands pages to a sync exporter, yielding an empty page whenever the next one hasn't arrived yet
+    def __init__(self):
+        self.pages = deque()
+        self.done = False
+        self.starved = False
+
+    def __iter__(self):
+        while True:
+            if self.pages:
+                yield self.pages.popleft()
+            elif self.done:
+                return
+            else:
+                self.starved = True
+                yield []
+
+
+def build_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": scope["client"][0] if scope.get("client") else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1")
+        if name == "content-type":
+            key = "CONTENT_TYPE"
+        elif name == "content-length":
+            key = "CONTENT_LENGTH"
+        else:
+            key = f"HTTP_{name.upper().replace('-', '_')}"
+        value = value.decode("latin-1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def read_body(receive):
+    body = bytearray()
+    limit = app.config["MAX_CONTENT_LENGTH"]
+    while True:
+        message = await receive()
+        # Oversized uploads are left to Flask, which rejects them from the declared length
+        if limit is None or len(body) <= limit:
+            body.extend(message.get("body", b""))
+        if not message.get("more_body"):
+            return bytes(body)
+
+
+async def send_response(send, response, environ):
+    headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in response.get_wsgi_headers(environ).items()]
+    await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+    try:
+        if isinstance(response, StreamingResponse):
+            async for chunk in response.chunks:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        else:
+            for chunk in response.iter_encoded():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        response.close()
+
+
+async def handle(scope, receive, send, view):
+    environ = build_environ(scope, await read_body(receive))
+    current_request = app.request_class(environ)
+    current_request.json_module = app.json
+
+    # The session store is SQLite by default, so the session is loaded and saved (in finalize_request) in a worker thread
+    current_session = await asyncio.to_thread(app.session_interface.open_session, app, current_request)
+    if current_session is None:
+        current_session = app.session_interface.make_null_session(app)
+
+    with RequestContext(app, environ, current_request, current_session):
+        try:
+            try:
+                response = app.preprocess_request()
+                if response is None:
+                    response = await view()
+            except Exception as error:
+                response = app.handle_user_exception(error)
+            response = await asyncio.to_thread(app.finalize_request, response)
+        except Exception as error:
+            response = app.make_response(app.handle_exception(error))
+
+    await send_response(send, response, environ)
+
+
+async def handle_wsgi(scope, receive, send):
+    environ = build_environ(scope, await read_body(receive))
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+    # Streamed bodies are pulled from the worker thread one chunk at a time
+    body = await asyncio.to_thread(app, environ, start_response)
+    chunks = iter(body)
+    try:
+        chunk = await asyncio.to_thread(next, chunks, None)
+        await send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+        while chunk is not None:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            chunk = await asyncio.to_thread(next, chunks, None)
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(body, "close"):
+            await asyncio.to_thread(body.close)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(config.WSGI_THREADS))
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await aspotify.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+
+    match = routes.get(scope["path"]) if scope["type"] == "http" else None
+    if match is None or scope["method"] not in match[0]:
+        return await handle_wsgi(scope, receive, send)
+
+    await handle(scope, receive, send, match[1])
+
+
+async def refresh_token():
+    if token_expired():
+        headers, parameters = token_refresh_request()
+        response = await aspotify.post(config.TOKEN_URL, headers=headers, params=parameters)
+        return store_refreshed_token(response.json())
+
+
+async def get_server_token():
+    token = cached_server_token()
+    if token:
+        return token
+    # Refreshing is rare and coordinates with other workers through a file lock, so it runs in a thread
+    return await asyncio.to_thread(helpers.get_server_token)
+
+
+async def get_user_id(headers):
+    if "user_id" in session:
+        return session["user_id"]
+    return store_user_id(await aspotify.get(f"{config.API_URL}/me", headers=headers))
+
+
+async def gather_bounded(function, items, workers):
+    semaphore = asyncio.Semaphore(workers)
+
+    async def run(item):
+        async with semaphore:
+            return await function(item)
+    return await asyncio.gather(*(run(item) for item in items))
+
+
+async def conditional_get(page_request, headers):
+    url, parameters, cached_page = page_request
+    response = await aspotify.get(url, params=parameters, headers=conditional_headers(headers, cached_page))
+    return conditional_page(response, cached_page)
+
+
+async def get_playlist_index(user_id, headers):
+    start = time.perf_counter()
+    prefetched = prefetch.claim(user_id)
+    index = await load_playlist_index(user_id, headers)
+    metrics.record_first_page(prefetched, time.perf_counter() - start)
+    return index
+
+
+async def load_playlist_index(user_id, headers):
+    cached, fresh = cached_playlist_index(user_id)
+    if fresh:
+        return cached
+
+    first_page, saved_songs = await asyncio.gather(conditional_get(playlists_request(cached, 0), headers), conditional_get(saved_songs_request(cached), headers))
+    offsets = playlist_index_offsets(first_page)
+    results = await gather_bounded(lambda offset: conditional_get(playlists_request(cached, offset), headers), offsets, config.PAGE_FETCH_WORKERS)
+
+    return store_playlist_index(user_id, {0: first_page, **dict(zip(offsets, results))}, saved_songs)
+
+
+async def get_artists(artist_ids, headers):
+    artists, missing = cached_artists(artist_ids)
+    responses = await asyncio.gather(*(aspotify.get(f"{config.API_URL}/artists", params=parameters, headers=headers) for parameters in artist_batches(missing)))
+    return store_artists(artist_ids, artists, responses)
+
+
+async def iter_remaining_pages(url, headers, parameters, first_page):
+    yield parse_items(first_page.get("items", []))
+
+    async def fetch_page(offset):
+        return page_items(await aspotify.get(url, params={**parameters, "offset": offset}, headers=headers))
+
+    # Same window as bounded_map: a few pages in flight, yielded in order
+    offsets = iter(remaining_offsets(parameters, first_page))
+    pending = deque(asyncio.ensure_future(fetch_page(offset)) for offset in islice(offsets, config.PAGE_FETCH_WORKERS))
+    try:
+        while pending:
+            page = await pending.popleft()
+            for offset in islice(offsets, 1):
+                pending.append(asyncio.ensure_future(fetch_page(offset)))
+            yield page
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def fetch_remaining_pages(url, headers, parameters, first_page):
+    return [track async for page in iter_remaining_pages(url, headers, parameters, first_page) for track in page]
+
+
+async def export_chunks(pages, write):
+    feed = PageFeed()
+    try:
+        for chunk in write(iter(feed)):
+            if chunk:
+                yield chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+            if feed.starved:
+                feed.starved = False
+                page = await anext(pages, None)
+                if page is None:
+                    feed.done = True
+                else:
+                    feed.pages.append(page)
+    finally:
+        await pages.aclose()
+
+
+def download_playlist(pages, export_format="csv", cache_as=None):
+    exporter = exporters[export_format]
+
+    def write(feed):
+        # The feed is a plain iterator, so the pages are cached on their way to the exporter by the same code as in app.py
+        return exporter["write"](cache_playlist_pages(*cache_as, feed) if cache_as else feed)
+
+    return download_response(export_chunks(pages, write), exporter, StreamingResponse)
+
+
+@route("/download")
+async def download():
+    playlist_id = request.args.get("playlist")
+    export_format = request.args.get("format", "csv")
+
+    if not playlist_id or export_format not in exporters:
+        return redirect("/not-found")
+
+    await refresh_token()
+
+    url, parameters = tracks_request(playlist_id)
+    headers = {
+        "Authorization": f"Bearer {session['access_token']}"
+    }
+
+    response = await aspotify.get(url, params=parameters, headers=headers)
+    if response.status_code != 200:
+        return spotify_failed(spotify.response_error(response))
+
+    return download_playlist(iter_remaining_pages(url, headers, parameters, response.json()), export_format)
+
+
+@route("/restore", methods=["POST"])
+async def restore():
+    # Saving the upload writes it to disk, reads its columns and inserts the job, so it runs in a worker thread
+    job_id = await asyncio.to_thread(save_restore_upload)
+    if job_id is None:
+        return redirect("/restore")
+
+    await refresh_token()
+    return await asyncio.to_thread(start_restore, job_id)
+
+
+@route("/download-csv", methods=["POST"])
+async def download_csv():
+    export_format = request.form.get("format", "csv")
+    playlist_id = download_link_id(request.form.get("playlist"), export_format)
+    if not playlist_id:
+        return redirect("/download-csv")
+
+    server_token = await get_server_token()
+    if not server_token:
+        return redirect("/error")
+
+    url, parameters = tracks_request(playlist_id)
+    headers = {
+        "Authorization": f"Bearer {server_token}"
+    }
+
+    playlist_details = await aspotify.get(f"{config.API_URL}/playlists/{playlist_id}", params={"market": "US", "fields": "snapshot_id"}, headers=headers)
+    if not playlist_available(playlist_details, "download_error"):
+        return redirect("/download-csv")
+
+    snapshot_id = playlist_details.json().get("snapshot_id")
+    songs = cached_playlist_tracks(playlist_id, snapshot_id)
+    if songs is not None:
+        return helpers.download_playlist([songs], export_format)
+
+    response = await aspotify.get(url, params=parameters, headers=headers)
+    if not playlist_available(response, "download_error"):
+        return redirect("/download-csv")
+
+    return download_playlist(iter_remaining_pages(url, headers, parameters, response.json()), export_format, (playlist_id, snapshot_id))
+
+
+@route("/analyze-playlist")
+async def analyze_playlist():
+    if "access_token" not in session:
+        return render_analyze()
+
+    await refresh_token()
+
+    headers = {
+        "Authorization": f"Bearer {session['access_token']}"
+    }
+    user_id = await get_user_id(headers)
+    index = await get_playlist_index(user_id, headers)
+    return render_analyze(index["items"])
+
+
+@route("/analyzed")
+async def analyzed():
+    playlist_id = playlist_link_id(request.args.get("playlist"), "analyze_error")
+    if not playlist_id:
+        return redirect("/analyze-playlist")
+
+    server_token = await get_server_token()
+    if not server_token:
+        return redirect("/error")
+
+    url, parameters = tracks_request(playlist_id)
+    headers = {
+        "Authorization": f"Bearer {server_token}"
+    }
+
+    playlist_details = await aspotify.get(f"{config.API_URL}/playlists/{playlist_id}", params={"market": "US", "fields": "name,images,snapshot_id"}, headers=headers)
+    if not playlist_available(playlist_details, "analyze_error"):
+        return redirect("/analyze-playlist")
+
+    playlist_details = playlist_details.json()
+    snapshot_id = playlist_details.get("snapshot_id")
+
+    songs = cached_playlist_tracks(playlist_id, snapshot_id)
+    if songs is None:
+        response = await aspotify.get(url, params=parameters, headers=headers)
+        if not playlist_available(response, "analyze_error"):
+            return redirect("/analyze-playlist")
+        response = response.json()
+
+    if not analyzable_length(len(songs) if songs is not None else response["total"]):
+        return redirect("/analyze-playlist")
+
+    if songs is None:
+        try:
+            songs = await fetch_remaining_pages(url, headers, parameters, response)
+        except spotify.SpotifyError as error:
+            return analysis_failed(error)
+        cache_playlist_tracks(playlist_id, snapshot_id, songs)
+
+    stats = analytics.analyze(songs)
+    artist_ids = [i[0] for i in stats["top_artists"]]
+
+    artist_data = await get_artists(artist_ids, headers)
+    return render_analysis(playlist_details, stats, artist_data)
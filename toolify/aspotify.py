@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+import httpx
+
+import config
+import metrics
+import spotify
+
+client = None
+
+
+def get_client():
+    # One client per process so every async request shares its connection pool
+    global client
+    if client is None:
+        client = httpx.AsyncClient(
+            # Waiting for a pooled connection is the backpressure, so only the request itself times out
+            timeout=httpx.Timeout(config.HTTP_TIMEOUT, pool=None),
+            limits=httpx.Limits(max_connections=config.ASYNC_MAX_CONNECTIONS, max_keepalive_connections=config.ASYNC_MAX_CONNECTIONS),
+            transport=httpx.AsyncHTTPTransport(retries=config.HTTP_RETRIES)
+        )
+    return client
+
+
+async def close():
+    global client
+    if client is not None:
+        await client.aclose()
+        client = None
+
+
+async def request(method, url, **kwargs):
+    paginated = "offset" in (kwargs.get("params") or {})
+    attempt = 0
+    server_errors = 0
+    while True:
+        queued = await spotify.scheduler.acquire_async()
+        start = time.perf_counter()
+        try:
+            response = await get_client().request(method, url, **kwargs)
+        except httpx.HTTPError:
+            metrics.record_call(method, url, "error", time.perf_counter() - start, 0, queued, paginated)
+            raise
+        metrics.record_call(method, url, response.status_code, time.perf_counter() - start, len(response.content), queued, paginated)
+
+        # Mirrors the sync session's urllib3 retry policy for idempotent calls
+        if method == "GET" and response.status_code in [500, 502, 503, 504] and server_errors < config.HTTP_RETRIES:
+            await asyncio.sleep(config.HTTP_BACKOFF * 2 ** server_errors)
+            server_errors += 1
+            continue
+
+        if response.status_code != 429 or attempt >= config.RATE_LIMIT_RETRIES:
+            return response
+
+        retry_after = spotify.retry_delay(response, attempt)
+        if retry_after > config.RATE_LIMIT_MAX_WAIT:
+            return response
+
+        spotify.scheduler.throttle(retry_after)
+        attempt += 1
+
+
+async def get(url, **kwargs):
+    return await request("GET", url, **kwargs)
+
+
+async def post(url, **kwargs):
+    return await request("POST", url, **kwargs)
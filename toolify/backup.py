@@ -0,0 +1,151 @@
+import csv
+import json
+import os
+import re
+import shutil
+import zipfile
+from datetime import datetime
+
+import backup_index
+import config
+from exporters import FIELDNAMES, exporters, track_row
+from helpers import bounded_map, get_playlist_index, iter_pages
+import jobs
+import spotify
+from track_records import ITEM_FIELDS
+
+
+def backup_archive_path(job_id):
+    return os.path.join(config.BACKUP_DIR, f"{job_id}.zip")
+
+
+jobs.artifacts["backup"] = [backup_archive_path]
+
+
+def backup_file_name(playlist):
+    name = re.sub(r"[^\w\- ]", "_", playlist.get("name") or "Untitled").strip()[:80]
+    return f"{name} ({playlist['id']}).csv"
+
+
+def saved_songs_snapshot(saved_songs):
+    # Liked Songs has no snapshot_id, so the total and the most recent addition stand in for one
+    items = saved_songs.get("items") or [{}]
+    return f"{saved_songs.get('total')}:{items[0].get('added_at')}"
+
+
+def write_backup_diff(path, pages, previous_uris, track_uris):
+    previous = set(previous_uris)
+    fieldnames = ["Change"] + FIELDNAMES
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer.writeheader()
+        for page in pages:
+            for track in page:
+                if track.uri not in previous:
+                    writer.writerow({"Change": "added", **track_row(track)})
+
+        current = set(track_uris)
+        for uri in previous_uris:
+            if uri not in current:
+                writer.writerow({"Change": "removed", "spotify_id": uri})
+
+
+def backup_library(job_id, access_token, user_id, mode="full"):
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+    index = get_playlist_index(user_id, headers)
+    if index is None:
+        raise jobs.JobError("Unable to load your playlists. Please login again.")
+
+    parameters = {
+        "market": "US",
+        "limit": 50,
+        "offset": 0
+    }
+    playlists = [{
+        "id": "saved",
+        "name": "Liked Songs",
+        "snapshot_id": saved_songs_snapshot(index["saved_songs"]["data"]),
+        "url": config.SAVED_SONGS,
+        "parameters": parameters,
+        "file": "Liked Songs.csv"
+    }]
+    for playlist in index["items"]:
+        if playlist:
+            playlists.append({
+                "id": playlist["id"],
+                "name": playlist.get("name"),
+                "snapshot_id": playlist.get("snapshot_id"),
+                "url": f"{config.API_URL}/playlists/{playlist['id']}/tracks",
+                "parameters": {**parameters, "fields": ITEM_FIELDS},
+                "file": backup_file_name(playlist)
+            })
+
+    work_dir = os.path.join(config.BACKUP_DIR, job_id)
+    os.makedirs(work_dir, exist_ok=True)
+    jobs.update_job(job_id, total=len(playlists))
+
+    def export(playlist):
+        previous = backup_index.get_state(user_id, playlist["id"]) if mode == "incremental" else None
+        if previous and playlist["snapshot_id"] and previous["snapshot_id"] == playlist["snapshot_id"]:
+            playlist["status"] = "unchanged"
+            playlist["tracks"] = len(previous["track_uris"])
+            return playlist, None, None
+
+        path = os.path.join(work_dir, f"{playlist['id']}.csv")
+        playlist["status"] = "changed" if previous else "full"
+        track_uris = []
+
+        def pages():
+            for page in iter_pages(playlist["url"], headers, playlist["parameters"]):
+                track_uris.extend(track.uri for track in page)
+                yield page
+
+        try:
+            if previous:
+                write_backup_diff(path, pages(), previous["track_uris"], track_uris)
+            else:
+                with open(path, "w", newline="", encoding="utf-8") as file:
+                    for chunk in exporters["csv"]["write"](pages()):
+                        file.write(chunk)
+        except spotify.SpotifyError as error:
+            os.remove(path)
+            return playlist, None, f"Spotify API returned {error.status_code}"
+
+        playlist["tracks"] = len(track_uris)
+        if previous:
+            previous_uris = set(previous["track_uris"])
+            current_uris = set(track_uris)
+            playlist["added"] = len(current_uris - previous_uris)
+            playlist["removed"] = len(previous_uris - current_uris)
+            playlist["file"] = playlist["file"][:-len(".csv")] + ".diff.csv"
+        backup_index.save_state(user_id, playlist["id"], playlist["snapshot_id"], track_uris)
+        return playlist, path, None
+
+    manifest = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "mode": mode,
+        "playlists": []
+    }
+    archive_path = backup_archive_path(job_id)
+    try:
+        with zipfile.ZipFile(archive_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for done, (playlist, path, error) in enumerate(bounded_map(export, playlists, config.BACKUP_WORKERS), start=1):
+                entry = {key: playlist.get(key) for key in ["id", "name", "snapshot_id", "status", "tracks", "added", "removed"] if key in playlist}
+                if error:
+                    entry["error"] = error
+                elif path:
+                    archive.write(path, playlist["file"])
+                    os.remove(path)
+                    entry["file"] = playlist["file"]
+                manifest["playlists"].append(entry)
+                jobs.update_job(job_id, progress=done)
+
+            archive.writestr("manifest.json", json.dumps(manifest, indent=2, ensure_ascii=False))
+    finally:
+        # Whatever stopped the export, the per-playlist files already written are only ever read into the archive
+        shutil.rmtree(work_dir, ignore_errors=True)
+    failed = sum(1 for entry in manifest["playlists"] if "error" in entry)
+    unchanged = sum(1 for entry in manifest["playlists"] if entry.get("status") == "unchanged")
+    return {"playlists": len(playlists) - failed, "failed": failed, "unchanged": unchanged}
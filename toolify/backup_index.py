@@ -0,0 +1,27 @@
+import sqlite3
+import threading
+import time
+
+import config
+
+local = threading.local()
+
+
+def connect():
+    if not hasattr(local, "db"):
+        local.db = sqlite3.connect(config.BACKUP_INDEX_DB, timeout=30)
+        local.db.execute("PRAGMA journal_mode=WAL")
+        local.db.execute("CREATE TABLE IF NOT EXISTS backups (user_id TEXT, playlist_id TEXT, snapshot_id TEXT, track_uris TEXT, backed_up_at REAL, PRIMARY KEY (user_id, playlist_id))")
+    return local.db
+
+
+def get_state(user_id, playlist_id):
+    row = connect().execute("SELECT snapshot_id, track_uris FROM backups WHERE user_id = ? AND playlist_id = ?", (user_id, playlist_id)).fetchone()
+    if row is None:
+        return None
+    return {"snapshot_id": row[0], "track_uris": row[1].split("\n") if row[1] else []}
+
+
+def save_state(user_id, playlist_id, snapshot_id, track_uris):
+    with connect() as db:
+        db.execute("INSERT OR REPLACE INTO backups VALUES (?, ?, ?, ?, ?)", (user_id, playlist_id, snapshot_id, "\n".join(track_uris), time.time()))
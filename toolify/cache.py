@@ -0,0 +1,222 @@
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import config
+import metrics
+
+caches = {}
+
+
+class MemoryCache:
+    backend = "memory"
+
+    def __init__(self, name, max_entries, max_bytes, ttl):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self.remove(key)
+                self.misses += 1
+                metrics.record_cache(False)
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+        metrics.record_cache(True)
+        return entry[2]
+
+    def set(self, key, value, size=None):
+        if size is None:
+            size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.bytes += size
+
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def get_many(self, keys):
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set_many(self, items):
+        for key, value in items.items():
+            self.set(key, value)
+
+    def delete(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+
+    def remove(self, key):
+        self.bytes -= self.entries.pop(key)[1]
+
+    def usage(self):
+        return len(self.entries), self.bytes
+
+    def stats(self):
+        entries, size = self.usage()
+        return {
+            "name": self.name,
+            "backend": self.backend,
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+class SQLiteCache(MemoryCache):
+    backend = "sqlite"
+
+    def __init__(self, name, max_entries, max_bytes, ttl, path=None):
+        super().__init__(name, max_entries, max_bytes, ttl)
+        self.path = path or config.CACHE_DB
+        self.local = threading.local()
+        with self.connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS cache (name TEXT, key TEXT, value BLOB, size INTEGER, expires REAL, accessed REAL, PRIMARY KEY (name, key))")
+            db.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (name, expires)")
+            db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (name, accessed)")
+            # Every process writes the same file, so the entry count and size taken here are kept up to date by triggers
+            db.execute("CREATE TABLE IF NOT EXISTS cache_usage (name TEXT PRIMARY KEY, entries INTEGER, bytes INTEGER)")
+            db.execute("""CREATE TRIGGER IF NOT EXISTS cache_added AFTER INSERT ON cache BEGIN
+                UPDATE cache_usage SET entries = entries + 1, bytes = bytes + new.size WHERE name = new.name;
+            END""")
+            db.execute("""CREATE TRIGGER IF NOT EXISTS cache_removed AFTER DELETE ON cache BEGIN
+                UPDATE cache_usage SET entries = entries - 1, bytes = bytes - old.size WHERE name = old.name;
+            END""")
+            db.execute("INSERT OR REPLACE INTO cache_usage SELECT ?, COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE name = ?", (self.name, self.name))
+
+    def connect(self):
+        if not hasattr(self.local, "db"):
+            self.local.db = sqlite3.connect(self.path, timeout=30)
+            self.local.db.execute("PRAGMA journal_mode=WAL")
+            # INSERT OR REPLACE only fires the delete trigger for the replaced row with this on
+            self.local.db.execute("PRAGMA recursive_triggers = ON")
+        return self.local.db
+
+    def get(self, key):
+        now = time.time()
+        with self.connect() as db:
+            row = db.execute("SELECT value, expires FROM cache WHERE name = ? AND key = ?", (self.name, key)).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    db.execute("DELETE FROM cache WHERE name = ? AND key = ?", (self.name, key))
+                with self.lock:
+                    self.misses += 1
+                metrics.record_cache(False)
+                return None
+
+            db.execute("UPDATE cache SET accessed = ? WHERE name = ? AND key = ?", (now, self.name, key))
+
+        with self.lock:
+            self.hits += 1
+        metrics.record_cache(True)
+        return pickle.loads(row[0])
+
+    def set(self, key, value, size=None):
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+
+        now = time.time()
+        with self.connect() as db:
+            db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)", (self.name, key, blob, len(blob), now + self.ttl, now))
+            self.evict(db, now)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        now = time.time()
+        values = {}
+        with self.connect() as db:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = db.execute(f"SELECT key, value FROM cache WHERE name = ? AND expires >= ? AND key IN ({','.join('?' * len(chunk))})", (self.name, now, *chunk))
+                for key, value in rows:
+                    values[key] = pickle.loads(value)
+            db.executemany("UPDATE cache SET accessed = ? WHERE name = ? AND key = ?", [(now, self.name, key) for key in values])
+
+        with self.lock:
+            self.hits += len(values)
+            self.misses += len(keys) - len(values)
+        for key in keys:
+            metrics.record_cache(key in values)
+        return values
+
+    def set_many(self, items):
+        if not items:
+            return
+
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            if len(blob) <= self.max_bytes:
+                rows.append((self.name, key, blob, len(blob), now + self.ttl, now))
+
+        with self.connect() as db:
+            db.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.evict(db, now)
+
+    def evict(self, db, now):
+        count, total = self.usage()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        db.execute("DELETE FROM cache WHERE name = ? AND expires < ?", (self.name, now))
+        count, total = self.usage()
+        evicted = []
+        if count > self.max_entries or total > self.max_bytes:
+            rows = db.execute("SELECT key, size FROM cache WHERE name = ? ORDER BY accessed", (self.name,))
+            for old_key, old_size in rows:
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                evicted.append((self.name, old_key))
+                count -= 1
+                total -= old_size
+            db.executemany("DELETE FROM cache WHERE name = ? AND key = ?", evicted)
+
+        with self.lock:
+            self.evictions += len(evicted)
+
+    def delete(self, key):
+        with self.connect() as db:
+            db.execute("DELETE FROM cache WHERE name = ? AND key = ?", (self.name, key))
+
+    def usage(self):
+        return self.connect().execute("SELECT entries, bytes FROM cache_usage WHERE name = ?", (self.name,)).fetchone() or (0, 0)
+
+
+def create_cache(name, max_entries, max_bytes, ttl, backend=None):
+    backend = backend or config.CACHE_BACKEND
+    if backend == "sqlite":
+        caches[name] = SQLiteCache(name, max_entries, max_bytes, ttl)
+    else:
+        caches[name] = MemoryCache(name, max_entries, max_bytes, ttl)
+    return caches[name]
@@ -0,0 +1,137 @@
+import numpy as np
+
+# Columns of the playlist x item incidence matrix multiplied at a time, keeps the dense block to a few MiB
+BLOCK_SIZE = 2048
+
+
+def build_sets(playlists):
+    track_index = {}
+    artist_index = {}
+    track_names = []
+    entries = []
+    track_sets = []
+    artist_sets = []
+
+    # Track URIs and artist IDs are interned to integer codes, each playlist becomes sorted unique code arrays
+    for playlist, tracks in playlists:
+        track_codes = []
+        artist_codes = []
+        for track in tracks:
+            if not track.uri:
+                continue
+            code = track_index.get(track.uri)
+            if code is None:
+                code = track_index[track.uri] = len(track_index)
+                track_names.append((track.name, ", ".join(track.artist_names)))
+            track_codes.append(code)
+            artist_codes.extend(artist_index.setdefault(artist_id, len(artist_index)) for artist_id in track.artist_ids)
+
+        track_set = np.unique(np.array(track_codes, dtype=np.int32))
+        track_sets.append(track_set)
+        artist_sets.append(np.unique(np.array(artist_codes, dtype=np.int32)))
+        entries.append({**playlist, "tracks": len(track_set), "repeats": len(track_codes) - len(track_set)})
+
+    return {
+        "playlists": entries,
+        "track_sets": track_sets,
+        "artist_sets": artist_sets,
+        "track_ids": list(track_index),
+        "track_names": track_names,
+        "artist_count": len(artist_index)
+    }
+
+
+def memberships(sets):
+    # Every (item, playlist) pair sorted by item, with where each item's run of playlists starts and how long it is
+    sizes = np.array([len(codes) for codes in sets], dtype=np.int64)
+    codes = np.concatenate(sets) if sets else np.array([], dtype=np.int32)
+    owners = np.repeat(np.arange(len(sets), dtype=np.int32), sizes)
+    order = np.argsort(codes, kind="stable")
+    codes, owners = codes[order], owners[order]
+
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.array([], dtype=np.int64)
+    counts = np.diff(np.r_[starts, len(codes)])
+    return sizes, codes, owners, starts, counts
+
+
+def overlap_matrix(sets):
+    sizes, codes, owners, starts, counts = memberships(sets)
+    overlap = np.zeros((len(sets), len(sets)), dtype=np.int64)
+
+    # Items in a single playlist only count towards its own size, so only shared ones are multiplied
+    shared = np.repeat(counts > 1, counts)
+    columns = np.repeat(np.cumsum(counts > 1) - 1, counts)[shared]
+    owners = owners[shared]
+
+    bounds = np.searchsorted(columns, np.arange(0, (columns[-1] + 1 if len(columns) else 0) + BLOCK_SIZE, BLOCK_SIZE))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if start == end:
+            continue
+        block = np.zeros((len(sets), BLOCK_SIZE), dtype=np.float32)
+        block[owners[start:end], columns[start:end] % BLOCK_SIZE] = 1
+        overlap += np.rint(block @ block.T).astype(np.int64)
+
+    overlap[np.diag_indices(len(sets))] = sizes
+    return overlap
+
+
+def jaccard(overlap):
+    sizes = np.diag(overlap)
+    union = sizes[:, None] + sizes[None, :] - overlap
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, overlap / union, 0.0)
+
+
+def top_pairs(track_overlap, track_jaccard, artist_overlap, artist_jaccard, limit):
+    first, second = np.triu_indices(len(track_overlap), 1)
+    scores = track_jaccard[first, second]
+    order = np.argsort(-scores, kind="stable")
+    order = order[track_overlap[first[order], second[order]] > 0][:limit]
+    return [{
+        "playlists": [first[i].item(), second[i].item()],
+        "shared_tracks": track_overlap[first[i], second[i]].item(),
+        "shared_artists": artist_overlap[first[i], second[i]].item(),
+        "jaccard": round(scores[i].item(), 3),
+        "artist_jaccard": round(artist_jaccard[first[i], second[i]].item(), 3)
+    } for i in order]
+
+
+def duplicates(library, limit):
+    sizes, codes, owners, starts, counts = memberships(library["track_sets"])
+    repeated = np.flatnonzero(counts > 1)
+    # Most widely duplicated first, ties in first-seen order
+    ranked = repeated[np.lexsort((codes[starts[repeated]], -counts[repeated]))][:limit]
+
+    report = []
+    for group in ranked:
+        code = codes[starts[group]].item()
+        name, artists = library["track_names"][code]
+        report.append({
+            "uri": library["track_ids"][code],
+            "name": name,
+            "artists": artists,
+            "playlists": owners[starts[group]:starts[group] + counts[group]].tolist()
+        })
+    return len(repeated), report
+
+
+def compare(playlists, pair_limit, duplicate_limit):
+    library = build_sets(playlists)
+    track_overlap = overlap_matrix(library["track_sets"])
+    artist_overlap = overlap_matrix(library["artist_sets"])
+    track_jaccard = jaccard(track_overlap)
+    artist_jaccard = jaccard(artist_overlap)
+    duplicate_count, duplicate_report = duplicates(library, duplicate_limit)
+
+    return {
+        "playlists": library["playlists"],
+        "unique_tracks": len(library["track_ids"]),
+        "unique_artists": library["artist_count"],
+        "duplicate_tracks": duplicate_count,
+        "duplicates": duplicate_report,
+        "pairs": top_pairs(track_overlap, track_jaccard, artist_overlap, artist_jaccard, pair_limit),
+        "track_overlap": track_overlap.tolist(),
+        "track_jaccard": track_jaccard.round(3).tolist(),
+        "artist_overlap": artist_overlap.tolist(),
+        "artist_jaccard": artist_jaccard.round(3).tolist()
+    }
@@ -5,7 +5,9 @@ from dotenv import load_dotenv
 load_dotenv()
 
 REDIRECT_URI = "http://127.0.0.1:5000/callback"
-TOKEN_URL = "https://accounts.spotify.com/api/token"
+API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1")
+ACCOUNTS_URL = os.getenv("SPOTIFY_ACCOUNTS_URL", "https://accounts.spotify.com")
+TOKEN_URL = f"{ACCOUNTS_URL}/api/token"
 STATE = os.getenv("SPOTIFY_STATE")
 CLIENT_ID = os.getenv("CLIENT_ID")
 CLIENT_SECRET = os.getenv("CLIENT_SECRET")
@@ -16,5 +18,94 @@ auth_bytes = auth_string.encode("utf-8")
 auth_base64 = base64.b64encode(auth_bytes)
 ENCODED_STRING = auth_base64.decode("utf-8")
 
-USER_PLAYLISTS = "https://api.spotify.com/v1/me/playlists"
-SAVED_SONGS = "https://api.spotify.com/v1/me/tracks"
\ No newline at end of file
+USER_PLAYLISTS = f"{API_URL}/me/playlists"
+SAVED_SONGS = f"{API_URL}/me/tracks"
+
+SERVER_TOKEN_MARGIN = int(os.getenv("SERVER_TOKEN_MARGIN", 300))
+SERVER_TOKEN_FILE = os.getenv("SERVER_TOKEN_FILE")
+
+PAGE_FETCH_WORKERS = int(os.getenv("PAGE_FETCH_WORKERS", 8))
+
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", 32))
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", API_POOL_SIZE))
+ACCOUNTS_POOL_SIZE = int(os.getenv("ACCOUNTS_POOL_SIZE", 8))
+ASYNC_MAX_CONNECTIONS = int(os.getenv("ASYNC_MAX_CONNECTIONS", 200))
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", 32))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 3))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", 0.3))
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_DB = os.getenv("CACHE_DB", "cache.db")
+
+PLAYLIST_CACHE_TTL = int(os.getenv("PLAYLIST_CACHE_TTL", 3600))
+PLAYLIST_CACHE_MAX_ENTRIES = int(os.getenv("PLAYLIST_CACHE_MAX_ENTRIES", 256))
+PLAYLIST_CACHE_MAX_BYTES = int(os.getenv("PLAYLIST_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+PLAYLIST_CACHE_MAX_TRACKS = int(os.getenv("PLAYLIST_CACHE_MAX_TRACKS", 5000))
+
+ARTIST_CACHE_TTL = int(os.getenv("ARTIST_CACHE_TTL", 24 * 3600))
+ARTIST_CACHE_MAX_ENTRIES = int(os.getenv("ARTIST_CACHE_MAX_ENTRIES", 10000))
+ARTIST_CACHE_MAX_BYTES = int(os.getenv("ARTIST_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOBS_DB = os.getenv("JOBS_DB", "jobs.db")
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", 120))
+JOB_ARTIFACT_TTL = int(os.getenv("JOB_ARTIFACT_TTL", 24 * 3600))
+JOB_CLEANUP_INTERVAL = int(os.getenv("JOB_CLEANUP_INTERVAL", 600))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", 0))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", 20))
+RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", 5))
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", 30))
+RATE_LIMIT_JITTER = float(os.getenv("RATE_LIMIT_JITTER", 0.25))
+
+PLAYLIST_INDEX_FRESH = int(os.getenv("PLAYLIST_INDEX_FRESH", 60))
+PLAYLIST_INDEX_TTL = int(os.getenv("PLAYLIST_INDEX_TTL", 3600))
+PLAYLIST_INDEX_MAX_ENTRIES = int(os.getenv("PLAYLIST_INDEX_MAX_ENTRIES", 1000))
+PLAYLIST_INDEX_MAX_BYTES = int(os.getenv("PLAYLIST_INDEX_MAX_BYTES", 64 * 1024 * 1024))
+
+BACKUP_PAGE_SIZE = int(os.getenv("BACKUP_PAGE_SIZE", 50))
+BACKUP_PAGE_WINDOW = int(os.getenv("BACKUP_PAGE_WINDOW", 2))
+BACKUP_PAGE_CACHE_TTL = int(os.getenv("BACKUP_PAGE_CACHE_TTL", 3600))
+BACKUP_PAGE_CACHE_MAX_ENTRIES = int(os.getenv("BACKUP_PAGE_CACHE_MAX_ENTRIES", 5000))
+BACKUP_PAGE_CACHE_MAX_BYTES = int(os.getenv("BACKUP_PAGE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "0") == "1"
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", 2))
+PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", 50))
+PREFETCH_MAX_USERS = int(os.getenv("PREFETCH_MAX_USERS", 1000))
+PREFETCH_MAX_PAGES = int(os.getenv("PREFETCH_MAX_PAGES", 20))
+PREFETCH_RESERVE_TOKENS = int(os.getenv("PREFETCH_RESERVE_TOKENS", 5))
+PREFETCH_BACKOFF = float(os.getenv("PREFETCH_BACKOFF", 0.5))
+PREFETCH_MAX_WAIT = float(os.getenv("PREFETCH_MAX_WAIT", 30))
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+SESSION_DB = os.getenv("SESSION_DB", "sessions.db")
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", 10000))
+SESSION_CLEANUP_INTERVAL = int(os.getenv("SESSION_CLEANUP_INTERVAL", 600))
+
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", 6))
+EXPORT_ROW_GROUP_SIZE = int(os.getenv("EXPORT_ROW_GROUP_SIZE", 5000))
+
+BACKUP_WORKERS = int(os.getenv("BACKUP_WORKERS", 4))
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+BACKUP_INDEX_DB = os.getenv("BACKUP_INDEX_DB", "backup_index.db")
+RESTORE_READ_CHUNK = int(os.getenv("RESTORE_READ_CHUNK", 256 * 1024))
+RESTORE_MAX_ERRORS = int(os.getenv("RESTORE_MAX_ERRORS", 50))
+RESTORE_MATCH_WORKERS = int(os.getenv("RESTORE_MATCH_WORKERS", 8))
+RESTORE_MATCH_CHUNK = int(os.getenv("RESTORE_MATCH_CHUNK", 500))
+
+COMPARE_WORKERS = int(os.getenv("COMPARE_WORKERS", 4))
+COMPARE_MAX_PLAYLISTS = int(os.getenv("COMPARE_MAX_PLAYLISTS", 500))
+COMPARE_MAX_TRACKS = int(os.getenv("COMPARE_MAX_TRACKS", 100000))
+COMPARE_PAIR_LIMIT = int(os.getenv("COMPARE_PAIR_LIMIT", 50))
+COMPARE_DUPLICATE_LIMIT = int(os.getenv("COMPARE_DUPLICATE_LIMIT", 500))
+
+ISRC_CACHE_BACKEND = os.getenv("ISRC_CACHE_BACKEND", "sqlite")
+ISRC_CACHE_TTL = int(os.getenv("ISRC_CACHE_TTL", 30 * 24 * 3600))
+ISRC_CACHE_MAX_ENTRIES = int(os.getenv("ISRC_CACHE_MAX_ENTRIES", 200000))
+ISRC_CACHE_MAX_BYTES = int(os.getenv("ISRC_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
@@ -0,0 +1,129 @@
+import csv
+import json
+import zlib
+from io import BytesIO, StringIO
+
+import config
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FIELDNAMES = ["Name", "Added at", "url", "spotify_id", "Album", "Album Url", "Artist", "Duration", "ISRC", "Explicit"]
+
+exporters = {}
+
+
+def exporter(name, mimetype, extension):
+    # Writers yield at least once per page, even an empty chunk, so the async path can feed pages as they arrive
+    def register(write):
+        exporters[name] = {"write": write, "mimetype": mimetype, "extension": extension}
+        return write
+    return register
+
+
+def ms_to_min(ms):
+    if not ms:
+        return ""
+    
+    sec = ms // 1000
+    minutes = sec // 60
+    seconds = sec % 60
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def track_row(track):
+    return {
+        "Name": track.name,
+        "Added at": track.added_at,
+        "url": track.url,
+        "spotify_id": track.uri,
+        "Album": track.album,
+        "Album Url": track.url,
+        "Artist": ", ".join(track.artist_names),
+        "Duration": ms_to_min(track.duration_ms),
+        "ISRC": track.isrc,
+        "Explicit": track.explicit,
+    }
+
+
+def rows(pages):
+    for tracks in pages:
+        yield [track_row(track) for track in tracks]
+
+
+def csv_chunks(pages):
+    output = StringIO()
+    writer = csv.DictWriter(output, fieldnames=FIELDNAMES)
+
+    writer.writeheader()
+    for page in rows(pages):
+        writer.writerows(page)
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate(0)
+
+
+@exporter("csv", "text/csv", "csv")
+def write_csv(pages):
+    yield from csv_chunks(pages)
+
+
+@exporter("csv.gz", "application/gzip", "csv.gz")
+def write_csv_gzip(pages):
+    # wbits=31 writes a gzip header so the stream can be compressed page by page
+    compressor = zlib.compressobj(config.EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in csv_chunks(pages):
+        yield compressor.compress(chunk.encode("utf-8"))
+    yield compressor.flush()
+
+
+@exporter("jsonl", "application/x-ndjson", "jsonl")
+def write_jsonl(pages):
+    for page in rows(pages):
+        yield "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in page)
+
+
+if pyarrow:
+    class ParquetSink:
+        def __init__(self):
+            self.buffer = BytesIO()
+            self.closed = False
+
+        def write(self, data):
+            self.buffer.write(data)
+            return len(data)
+
+        def flush(self):
+            pass
+
+        def close(self):
+            self.closed = True
+
+        def take(self):
+            data = self.buffer.getvalue()
+            self.buffer.seek(0)
+            self.buffer.truncate(0)
+            return data
+
+    @exporter("parquet", "application/vnd.apache.parquet", "parquet")
+    def write_parquet(pages):
+        schema = pyarrow.schema([(name, pyarrow.bool_() if name == "Explicit" else pyarrow.string()) for name in FIELDNAMES])
+        sink = ParquetSink()
+        writer = pyarrow.parquet.ParquetWriter(sink, schema, compression="snappy")
+
+        # Rows are grouped before writing so row groups stay a useful size while memory stays bounded
+        batch = []
+        for page in rows(pages):
+            batch.extend(page)
+            if len(batch) >= config.EXPORT_ROW_GROUP_SIZE:
+                writer.write_table(pyarrow.Table.from_pylist(batch, schema=schema))
+                batch = []
+            yield sink.take()
+
+        if batch:
+            writer.write_table(pyarrow.Table.from_pylist(batch, schema=schema))
+        writer.close()
+        yield sink.take()
@@ -1,90 +1,440 @@
-import csv
-import requests
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from flask import session, redirect, flash, Response
-from io import StringIO
+from flask import session, redirect, flash, render_template, Response
+from itertools import islice
+from math import ceil
 
+import cache
+import compare
 import config
+from exporters import exporters, ms_to_min
+import metrics
+import prefetch
+import spotify
+from track_records import ITEM_FIELDS, parse_items
+
+PLAYLIST_INDEX_LIMIT = 50
+
+playlist_cache = cache.create_cache("playlists", config.PLAYLIST_CACHE_MAX_ENTRIES, config.PLAYLIST_CACHE_MAX_BYTES, config.PLAYLIST_CACHE_TTL)
+artist_cache = cache.create_cache("artists", config.ARTIST_CACHE_MAX_ENTRIES, config.ARTIST_CACHE_MAX_BYTES, config.ARTIST_CACHE_TTL)
+playlist_index_cache = cache.create_cache("playlist_index", config.PLAYLIST_INDEX_MAX_ENTRIES, config.PLAYLIST_INDEX_MAX_BYTES, config.PLAYLIST_INDEX_TTL)
+backup_page_cache = cache.create_cache("backup_pages", config.BACKUP_PAGE_CACHE_MAX_ENTRIES, config.BACKUP_PAGE_CACHE_MAX_BYTES, config.BACKUP_PAGE_CACHE_TTL)
+fetch_executor = ThreadPoolExecutor(max_workers=config.FETCH_WORKERS)
+
+def token_refresh_request():
+    headers = {
+        "content-type": "application/x-www-form-urlencoded",
+        "Authorization": "Basic " + config.ENCODED_STRING
+    }
+    parameters = {
+        "grant_type": "refresh_token",
+        "refresh_token": session["refresh_token"],
+        "client_id": config.CLIENT_ID
+    }
+    return headers, parameters
+
+def store_refreshed_token(result):
+    if "access_token" in result:
+        session["access_token"] = result["access_token"]
+        if "refresh_token" in result:
+            session["refresh_token"] = result["refresh_token"]
+        session["expiry"] = datetime.now() + timedelta(seconds=3600)
+        return
+    else:
+        session.clear()
+        flash("Authorization failed. Please login again.", "authorization_failed")
+        return redirect("/")
+
+def token_expired():
+    return "expiry" in session and datetime.now() > session["expiry"]
 
 def refresh_token():
-    if "expiry" in session and datetime.now() > session["expiry"]:
-        headers = {
-            "content-type": "application/x-www-form-urlencoded",
-            "Authorization": "Basic " + config.ENCODED_STRING
-        }
-        parameters = {
-            "grant_type": "refresh_token",
-            "refresh_token": session["refresh_token"],
-            "client_id": config.CLIENT_ID
-        }
-
-        response = requests.post(config.TOKEN_URL, headers=headers, params=parameters)
-        result = response.json()
-
-        if "access_token" in result:
-            session["access_token"] = result["access_token"]
-            if "refresh_token" in result:
-                session["refresh_token"] = result["refresh_token"]
-            session["expiry"] = datetime.now() + timedelta(seconds=3600)
-            return
-        else:
-            session.clear()
-            flash("Authorization failed. Please login again.", "authorization_failed")
-            return redirect("/")
+    if token_expired():
+        headers, parameters = token_refresh_request()
+        response = spotify.post(config.TOKEN_URL, headers=headers, params=parameters)
+        return store_refreshed_token(response.json())
         
-def ms_to_min(ms):
-    if not ms:
-        return ""
-    
-    sec = ms // 1000
-    minutes = sec // 60
-    seconds = sec % 60
-    return f"{minutes:02d}:{seconds:02d}"
+server_token = {}
+server_token_lock = threading.Lock()
+
+def cached_server_token():
+    if server_token and datetime.now() < server_token["expiry"] - timedelta(seconds=config.SERVER_TOKEN_MARGIN):
+        return server_token["access_token"]
+    return None
+
+def request_server_token():
+    headers = {
+        "content-type": "application/x-www-form-urlencoded",
+        "Authorization": "Basic " + config.ENCODED_STRING
+    }
+    parameters = {
+        "grant_type": "client_credentials",
+    }
+
+    response = spotify.post(config.TOKEN_URL, headers=headers, params=parameters)
+    if response.status_code != 200:
+        return None
+
+    result = response.json()
+    return {
+        "access_token": result["access_token"],
+        "expiry": datetime.now() + timedelta(seconds=result.get("expires_in", 3600))
+    }
+
+def load_shared_server_token():
+    try:
+        with open(config.SERVER_TOKEN_FILE) as file:
+            shared = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return {
+        "access_token": shared["access_token"],
+        "expiry": datetime.fromisoformat(shared["expiry"])
+    }
+
+def save_shared_server_token(token):
+    # Unique per thread so concurrent writers never share a temp file, and owner-only since it holds a bearer token
+    temp_file = f"{config.SERVER_TOKEN_FILE}.{os.getpid()}.{threading.get_ident()}"
+    with open(os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as file:
+        json.dump({"access_token": token["access_token"], "expiry": token["expiry"].isoformat()}, file)
+    os.replace(temp_file, config.SERVER_TOKEN_FILE)
+
+def refresh_server_token():
+    if not config.SERVER_TOKEN_FILE:
+        return request_server_token()
+
+    # Hold an exclusive lock so only one worker process refreshes at a time
+    with open(f"{config.SERVER_TOKEN_FILE}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        token = load_shared_server_token()
+        if token and datetime.now() < token["expiry"] - timedelta(seconds=config.SERVER_TOKEN_MARGIN):
+            return token
+
+        token = request_server_token()
+        if token:
+            save_shared_server_token(token)
+        return token
 
 def get_server_token():
-    if "server_access_token" not in session or datetime.now() > session["server_expiry"]:
-        headers = {
-            "content-type": "application/x-www-form-urlencoded",
-            "Authorization": "Basic " + config.ENCODED_STRING
-        }
-        parameters = {
-            "grant_type": "client_credentials",
-        }
-
-        response = requests.post(config.TOKEN_URL, headers=headers, params=parameters)
-        result=response.json()
-
-        if not response.status_code == 200:
-            return redirect("/error")
-        
-        session["server_access_token"] = result["access_token"]
-        session["server_expiry"] = datetime.now() + timedelta(seconds=3600)
-        return
+    token = cached_server_token()
+    if token:
+        return token
+
+    with server_token_lock:
+        token = cached_server_token()
+        if token:
+            return token
+
+        token = refresh_server_token()
+        if not token:
+            return None
+
+        server_token.update(token)
+        return token["access_token"]
     
-def download_playlist(songs):
-    fieldnames = ["Name", "Added at", "url", "spotify_id", "Album", "Album Url", "Artist", "Duration", "ISRC", "Explicit"]
-    output = StringIO()
-    writer = csv.DictWriter(output, fieldnames=fieldnames)
+def bounded_map(function, iterable, workers):
+    iterable = iter(iterable)
+    function = metrics.bind(function)
 
-    writer.writeheader()
-    for song in songs:
-        
-        artists = ", ".join(a.get("name") for a in song["track"].get("artists", []))
-        duration = ms_to_min(song["track"].get("duration_ms"))
-
-        writer.writerow({
-            "Name": song["track"].get("name"),
-            "Added at": song.get("added_at"),
-            "url": song["track"]["external_urls"].get("spotify"),
-            "spotify_id": song["track"].get("uri"),
-            "Album": song["track"]["album"].get("name"),
-            "Album Url": song["track"]["external_urls"].get("spotify"),
-            "Artist": artists,
-            "Duration": duration,
-            "ISRC": song["track"]["external_ids"].get("isrc"),
-            "Explicit": song["track"].get("explicit"),
-            })
-
-    download = Response(output.getvalue(), mimetype="text/csv")
-    download.headers.set("Content-Disposition", "attachment", filename=f"{datetime.now().strftime('%Y-%m-%d')}_spotify_playlist.csv")
-    return download
\ No newline at end of file
+    # Keep at most `workers` calls in flight and yield results in order so memory stays bounded. Every map shares
+    # fetch_executor, so nested maps can't multiply threads past the connection pool, and a call still queued when
+    # its result is needed runs in the caller instead, so a map running on the pool never waits on the pool
+    pending = deque((fetch_executor.submit(function, item), item) for item in islice(iterable, workers))
+    try:
+        while pending:
+            future, item = pending.popleft()
+            result = function(item) if future.cancel() else future.result()
+            for item in islice(iterable, 1):
+                pending.append((fetch_executor.submit(function, item), item))
+            yield result
+    finally:
+        for future, _ in pending:
+            future.cancel()
+
+def tracks_request(playlist_id):
+    parameters = {
+        "market": "US",
+        "limit": 50,
+        "offset": 0
+    }
+    if playlist_id == "saved":
+        return config.SAVED_SONGS, parameters
+
+    parameters["fields"] = ITEM_FIELDS
+    return f"{config.API_URL}/playlists/{playlist_id}/tracks", parameters
+
+def remaining_offsets(parameters, first_page):
+    limit = first_page.get("limit") or parameters["limit"]
+    return range(parameters.get("offset", 0) + limit, first_page["total"], limit)
+
+def page_items(response):
+    if response.status_code != 200:
+        raise spotify.response_error(response)
+    return parse_items(response.json().get("items", []))
+
+def iter_remaining_pages(url, headers, parameters, first_page):
+    yield parse_items(first_page.get("items", []))
+
+    def fetch_page(offset):
+        return page_items(spotify.get(url, params={**parameters, "offset": offset}, headers=headers))
+
+    yield from bounded_map(fetch_page, remaining_offsets(parameters, first_page), config.PAGE_FETCH_WORKERS)
+
+def iter_pages(url, headers, parameters):
+    response = spotify.get(url, params=parameters, headers=headers)
+    if response.status_code != 200:
+        raise spotify.response_error(response)
+    return iter_remaining_pages(url, headers, parameters, response.json())
+
+def fetch_remaining_pages(url, headers, parameters, first_page):
+    return [track for page in iter_remaining_pages(url, headers, parameters, first_page) for track in page]
+
+def cached_playlist_tracks(playlist_id, snapshot_id):
+    cached = playlist_cache.get(playlist_id)
+    # Entries written before TrackRecords only have "items" and count as misses
+    if cached and cached["snapshot_id"] == snapshot_id and "tracks" in cached:
+        return cached["tracks"]
+    return None
+
+def cache_playlist_tracks(playlist_id, snapshot_id, items):
+    if snapshot_id and len(items) <= config.PLAYLIST_CACHE_MAX_TRACKS:
+        playlist_cache.set(playlist_id, {"snapshot_id": snapshot_id, "tracks": items})
+
+def cache_playlist_pages(playlist_id, snapshot_id, pages):
+    items = []
+    for page in pages:
+        if items is not None:
+            items.extend(page)
+            if len(items) > config.PLAYLIST_CACHE_MAX_TRACKS:
+                items = None
+        yield page
+
+    if items is not None:
+        cache_playlist_tracks(playlist_id, snapshot_id, items)
+
+def remember_job(job_id):
+    session["jobs"] = session.get("jobs", [])[-9:] + [job_id]
+
+def store_user_id(response):
+    if response.status_code != 200:
+        raise spotify.response_error(response)
+    session["user_id"] = response.json().get("id")
+    return session["user_id"]
+
+def get_user_id(headers):
+    if "user_id" in session:
+        return session["user_id"]
+    return store_user_id(spotify.get(f"{config.API_URL}/me", headers=headers))
+
+def conditional_headers(headers, cached_page):
+    if cached_page and cached_page.get("etag"):
+        return {**headers, "If-None-Match": cached_page["etag"]}
+    return headers
+
+def conditional_get(page_request, headers):
+    url, parameters, cached_page = page_request
+    response = spotify.get(url, params=parameters, headers=conditional_headers(headers, cached_page))
+    return conditional_page(response, cached_page)
+
+def conditional_page(response, cached_page):
+    if response.status_code == 304 and cached_page:
+        return cached_page
+    if response.status_code != 200:
+        raise spotify.response_error(response)
+    return {"etag": response.headers.get("ETag"), "data": response.json()}
+
+def cached_playlist_index(user_id):
+    cached = playlist_index_cache.get(user_id)
+    fresh = cached is not None and time.time() - cached["fetched"] < config.PLAYLIST_INDEX_FRESH
+    return cached, fresh
+
+# Each index request carries the cached copy of its page, revalidated by ETag so unchanged pages come back as bodiless 304s
+def playlists_request(cached, offset):
+    return config.USER_PLAYLISTS, {"limit": PLAYLIST_INDEX_LIMIT, "offset": offset}, cached["pages"].get(offset) if cached else None
+
+def saved_songs_request(cached):
+    return config.SAVED_SONGS, {"limit": 1}, cached and cached["saved_songs"]
+
+def playlist_index_offsets(first_page):
+    return list(range(PLAYLIST_INDEX_LIMIT, first_page["data"]["total"], PLAYLIST_INDEX_LIMIT))
+
+def get_playlist_index(user_id, headers):
+    start = time.perf_counter()
+    prefetched = prefetch.claim(user_id)
+    index = load_playlist_index(user_id, headers)
+    metrics.record_first_page(prefetched, time.perf_counter() - start)
+    return index
+
+def load_playlist_index(user_id, headers):
+    cached, fresh = cached_playlist_index(user_id)
+    if fresh:
+        return cached
+
+    first_page = conditional_get(playlists_request(cached, 0), headers)
+    saved_songs = conditional_get(saved_songs_request(cached), headers)
+
+    offsets = playlist_index_offsets(first_page)
+    pages = {0: first_page}
+    pages.update(zip(offsets, bounded_map(lambda offset: conditional_get(playlists_request(cached, offset), headers), offsets, config.PAGE_FETCH_WORKERS)))
+
+    return store_playlist_index(user_id, pages, saved_songs)
+
+def store_playlist_index(user_id, pages, saved_songs):
+    items = []
+    for offset in sorted(pages):
+        items.extend(pages[offset]["data"].get("items", []))
+
+    # Page ETags change whenever Spotify's listing does, so they identify this version of the index without hashing it
+    etags = [pages[offset].get("etag") for offset in sorted(pages)] + [saved_songs.get("etag")]
+    version = "".join(etags) if all(etags) else json.dumps([items, saved_songs["data"]["total"]], sort_keys=True)
+
+    index = {
+        "items": items,
+        "total": pages[0]["data"]["total"],
+        "saved_total": saved_songs["data"]["total"],
+        "pages": pages,
+        "saved_songs": saved_songs,
+        "version": hashlib.md5(version.encode("utf-8")).hexdigest(),
+        "fetched": time.time()
+    }
+    playlist_index_cache.set(user_id, index)
+    return index
+
+def page_window(page_number, total_pages):
+    # First, last and the pages around the current one, with None standing in for each run of skipped pages
+    nearby = range(max(1, page_number - config.BACKUP_PAGE_WINDOW), min(total_pages, page_number + config.BACKUP_PAGE_WINDOW) + 1)
+    window = []
+    for page in sorted({1, total_pages, *nearby}):
+        if window and page - window[-1] == 2:
+            window.append(page - 1)
+        elif window and page - window[-1] > 2:
+            window.append(None)
+        window.append(page)
+    return window
+
+def backup_page(user_id, index, page_number, total_pages):
+    # Rendered rows are keyed by the index version, so any change to the playlists or Liked Songs misses the old fragments
+    key = f"{user_id}:{index.get('version')}:{page_number}"
+    fragment = backup_page_cache.get(key) if index.get("version") else None
+    if fragment is not None:
+        return fragment
+
+    offset = (page_number - 1) * config.BACKUP_PAGE_SIZE
+    response = {
+        "items": index["items"][offset:offset + config.BACKUP_PAGE_SIZE],
+        "total": index["total"]
+    }
+    saved_songs = {
+        "total": index["saved_total"]
+    }
+    fragment = render_template("backup-page.html", response=response, page_number=page_number, total_pages=total_pages, pages=page_window(page_number, total_pages), saved_songs=saved_songs)
+    if index.get("version"):
+        backup_page_cache.set(key, fragment, size=len(fragment))
+    return fragment
+
+def prefetch_playlist_index(user_id, headers, cancelled):
+    cached, fresh = cached_playlist_index(user_id)
+    if fresh:
+        return "fresh"
+
+    # Unlike get_playlist_index this goes one page at a time and yields to foreground requests between pages
+    pages = {}
+    offset = 0
+    while offset == 0 or offset < pages[0]["data"]["total"]:
+        prefetch.yield_to_foreground(cancelled)
+        pages[offset] = conditional_get(playlists_request(cached, offset), headers)
+        if ceil(pages[0]["data"]["total"] / PLAYLIST_INDEX_LIMIT) > config.PREFETCH_MAX_PAGES:
+            return "over_budget"
+        offset += PLAYLIST_INDEX_LIMIT
+
+    prefetch.yield_to_foreground(cancelled)
+    saved_songs = conditional_get(saved_songs_request(cached), headers)
+    if cancelled.is_set():
+        return "cancelled"
+
+    store_playlist_index(user_id, pages, saved_songs)
+    return "stored"
+
+def start_prefetch(user_id, access_token):
+    headers = {
+        "Authorization": f"Bearer {access_token}"
+    }
+    prefetch.start(user_id, lambda cancelled: prefetch_playlist_index(user_id, headers, cancelled))
+
+def cached_artists(artist_ids):
+    artists = {}
+    missing = []
+    for artist_id in artist_ids:
+        artist = artist_cache.get(artist_id)
+        if artist is None:
+            missing.append(artist_id)
+        else:
+            artists[artist_id] = artist
+    return artists, missing
+
+def artist_batches(missing):
+    return [{"ids": ",".join(missing[i:i + 50])} for i in range(0, len(missing), 50)]
+
+def store_artists(artist_ids, artists, responses):
+    for response in responses:
+        if response.status_code != 200:
+            raise spotify.response_error(response)
+
+        for artist in response.json().get("artists", []):
+            if artist:
+                artist_cache.set(artist["id"], artist)
+                artists[artist["id"]] = artist
+
+    return [artists[artist_id] for artist_id in artist_ids if artist_id in artists]
+
+def get_artists(artist_ids, headers):
+    artists, missing = cached_artists(artist_ids)
+    responses = (spotify.get(f"{config.API_URL}/artists", params=parameters, headers=headers) for parameters in artist_batches(missing))
+    return store_artists(artist_ids, artists, responses)
+
+def playlist_details(playlist_id, headers):
+    response = spotify.get(f"{config.API_URL}/playlists/{playlist_id}", params={"market": "US", "fields": "id,name,snapshot_id,tracks.total"}, headers=headers)
+    if response.status_code != 200:
+        raise spotify.response_error(response)
+
+    details = response.json()
+    return {"id": playlist_id, "name": details.get("name"), "snapshot_id": details.get("snapshot_id"), "total": details["tracks"]["total"]}
+
+def library_playlists(index):
+    # Liked Songs has no snapshot, so it is never served from or written to the shared playlist cache
+    playlists = [{"id": "saved", "name": "Liked Songs", "snapshot_id": None, "total": index["saved_total"]}]
+    for playlist in index["items"]:
+        if playlist:
+            playlists.append({"id": playlist["id"], "name": playlist.get("name"), "snapshot_id": playlist.get("snapshot_id"), "total": playlist["tracks"]["total"]})
+    return playlists
+
+def playlist_records(playlist, headers):
+    tracks = cached_playlist_tracks(playlist["id"], playlist["snapshot_id"]) if playlist["snapshot_id"] else None
+    if tracks is not None:
+        return tracks
+
+    url, parameters = tracks_request(playlist["id"])
+    tracks = [track for page in iter_pages(url, headers, parameters) for track in page]
+    cache_playlist_tracks(playlist["id"], playlist["snapshot_id"], tracks)
+    return tracks
+
+def compare_playlists(playlists, headers):
+    # Playlists are fetched a few at a time and interned as they arrive, so only the in-flight ones are held as records
+    fetched = bounded_map(lambda playlist: ({"id": playlist["id"], "name": playlist["name"]}, playlist_records(playlist, headers)), playlists, config.COMPARE_WORKERS)
+    return compare.compare(fetched, config.COMPARE_PAIR_LIMIT, config.COMPARE_DUPLICATE_LIMIT)
+
+def download_response(body, exporter, response_class=Response):
+    download = response_class(body, mimetype=exporter["mimetype"])
+    download.headers.set("Content-Disposition", "attachment", filename=f"{datetime.now().strftime('%Y-%m-%d')}_spotify_playlist.{exporter['extension']}")
+    return download
+
+def download_playlist(pages, export_format="csv"):
+    exporter = exporters[export_format]
+    return download_response(exporter["write"](pages), exporter)
@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(max_workers=config.JOB_WORKERS)
+local = threading.local()
+# Jobs queued or running in this process, their rows carry this process's pid as owner
+owned = set()
+owned_lock = threading.Lock()
+# Files each kind of job leaves on disk for download or resume, removed along with the job once it expires
+artifacts = {}
+expired_at = 0
+expiry_lock = threading.Lock()
+
+
+class JobError(Exception):
+    pass
+
+
+def connect():
+    if not hasattr(local, "db"):
+        local.db = sqlite3.connect(config.JOBS_DB, timeout=30)
+        local.db.row_factory = sqlite3.Row
+        local.db.execute("PRAGMA journal_mode=WAL")
+        local.db.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT, status TEXT, progress INTEGER, total INTEGER, result TEXT, error TEXT, created REAL, updated REAL, owner INTEGER)")
+        if "owner" not in [column["name"] for column in local.db.execute("PRAGMA table_info(jobs)")]:
+            local.db.execute("ALTER TABLE jobs ADD COLUMN owner INTEGER")
+        local.db.execute("CREATE INDEX IF NOT EXISTS jobs_updated ON jobs (updated)")
+    return local.db
+
+
+def create_job(kind):
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with connect() as db:
+        db.execute("INSERT INTO jobs (id, kind, status, progress, created, updated, owner) VALUES (?, ?, 'queued', 0, ?, ?, ?)", (job_id, kind, now, now, os.getpid()))
+    return job_id
+
+
+def update_job(job_id, **fields):
+    if "result" in fields:
+        fields["result"] = json.dumps(fields["result"])
+    fields["updated"] = time.time()
+
+    columns = ", ".join(f"{column} = ?" for column in fields)
+    with connect() as db:
+        db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+
+def get_job(job_id):
+    row = connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def delete_job(job_id):
+    with connect() as db:
+        db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+
+def owner_alive(job):
+    if job["owner"] == os.getpid():
+        with owned_lock:
+            return job["id"] in owned
+    try:
+        os.kill(job["owner"], 0)
+    except (TypeError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def is_resumable(job):
+    if job["status"] == "failed":
+        return True
+    # Only a running job whose worker process is gone was interrupted; queued or slow jobs still have an owner that will finish them
+    return job["status"] == "running" and time.time() - job["updated"] > config.JOB_STALE_AFTER and not owner_alive(job)
+
+
+def expire():
+    cutoff = time.time() - config.JOB_ARTIFACT_TTL
+    for job in [dict(row) for row in connect().execute("SELECT id, kind, status, owner FROM jobs WHERE updated < ?", (cutoff,))]:
+        if job["status"] in ["queued", "running"] and owner_alive(job):
+            continue
+        for path in artifacts.get(job["kind"], []):
+            try:
+                os.remove(path(job["id"]))
+            except FileNotFoundError:
+                pass
+        delete_job(job["id"])
+
+
+def schedule_expiry():
+    global expired_at
+    with expiry_lock:
+        if time.time() - expired_at < config.JOB_CLEANUP_INTERVAL:
+            return
+        expired_at = time.time()
+    executor.submit(expire)
+
+
+def run(job_id, target, args):
+    update_job(job_id, status="running", owner=os.getpid())
+    try:
+        result = target(job_id, *args)
+    except JobError as error:
+        update_job(job_id, status="failed", error=str(error))
+    except Exception:
+        logger.exception("Job %s failed", job_id)
+        update_job(job_id, status="failed", error="Something went wrong. Please try again.")
+    else:
+        update_job(job_id, status="done", result=result)
+    finally:
+        with owned_lock:
+            owned.discard(job_id)
+
+
+def enqueue(job_id, target, args):
+    with owned_lock:
+        owned.add(job_id)
+    executor.submit(run, job_id, target, args)
+    schedule_expiry()
+
+
+def start(job_id, target, *args):
+    update_job(job_id, status="queued", error=None, owner=os.getpid())
+    enqueue(job_id, target, args)
+
+
+def resume(job, target, *args):
+    # Claims the job only if no one touched it since it was judged resumable, so two resumes can't both run it
+    with connect() as db:
+        claimed = db.execute("UPDATE jobs SET status = 'queued', error = NULL, owner = ?, updated = ? WHERE id = ? AND status = ? AND updated = ?",
+                             (os.getpid(), time.time(), job["id"], job["status"], job["updated"])).rowcount
+    if claimed:
+        enqueue(job["id"], target, args)
+    return bool(claimed)
+
+
+def submit(kind, target, *args):
+    job_id = create_job(kind)
+    enqueue(job_id, target, args)
+    return job_id
@@ -0,0 +1,205 @@
+import contextvars
+import re
+import threading
+import time
+from bisect import bisect_left
+from urllib.parse import urlsplit
+
+import config
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+ID_SEGMENT = re.compile(r"[A-Za-z0-9]{22}")
+ID_PARENTS = {"playlists": "{id}", "artists": "{id}", "users": "{user_id}"}
+
+DESCRIPTIONS = {
+    "toolify_spotify_requests_total": ("counter", "Outbound Spotify calls by endpoint, method and status."),
+    "toolify_spotify_response_bytes_total": ("counter", "Bytes received from Spotify by endpoint."),
+    "toolify_spotify_request_duration_seconds": ("histogram", "Outbound Spotify call latency by endpoint."),
+    "toolify_http_requests_total": ("counter", "Handled requests by route, method and status."),
+    "toolify_http_request_duration_seconds": ("histogram", "Request latency by route, including streamed bodies."),
+    "toolify_http_request_spotify_calls": ("histogram", "Outbound Spotify calls made per request."),
+    "toolify_http_request_spotify_pages": ("histogram", "Paginated Spotify pages fetched per request."),
+    "toolify_prefetch_runs_total": ("counter", "Background playlist index prefetches started at login, by outcome."),
+    "toolify_prefetch_first_page_seconds": ("histogram", "Time spent loading the playlist index on the first page after login, by whether prefetch had warmed it."),
+}
+
+lock = threading.Lock()
+counters = {}
+histograms = {}
+current = contextvars.ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.pages = 0
+        self.spotify_seconds = 0.0
+        self.queued_seconds = 0.0
+        self.bytes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def inc(name, labels, value=1):
+    key = (name, labels)
+    with lock:
+        counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, labels, value, buckets):
+    key = (name, labels)
+    with lock:
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+        index = bisect_left(buckets, value)
+        if index < len(buckets):
+            histogram[1][index] += 1
+        histogram[2] += value
+        histogram[3] += 1
+
+
+def endpoint_template(url):
+    # Collapse IDs so every playlist, user and artist shares one series, whatever the caller passed as the ID
+    segments = urlsplit(url).path.split("/")
+    for i, segment in enumerate(segments):
+        if i and segments[i - 1] in ID_PARENTS:
+            segments[i] = ID_PARENTS[segments[i - 1]]
+        elif ID_SEGMENT.fullmatch(segment):
+            segments[i] = "{id}"
+    return "/".join(segments)
+
+
+def record_call(method, url, status, seconds, size, queued, paginated):
+    if not config.METRICS_ENABLED:
+        return
+
+    endpoint = endpoint_template(url)
+    inc("toolify_spotify_requests_total", (("endpoint", endpoint), ("method", method), ("status", str(status))))
+    inc("toolify_spotify_response_bytes_total", (("endpoint", endpoint),), size)
+    observe("toolify_spotify_request_duration_seconds", (("endpoint", endpoint),), seconds, LATENCY_BUCKETS)
+
+    request_metrics = current.get()
+    if request_metrics is not None:
+        with request_metrics.lock:
+            request_metrics.calls += 1
+            request_metrics.pages += paginated
+            request_metrics.spotify_seconds += seconds
+            request_metrics.queued_seconds += queued
+            request_metrics.bytes += size
+
+
+def record_cache(hit):
+    request_metrics = current.get()
+    if request_metrics is not None:
+        with request_metrics.lock:
+            if hit:
+                request_metrics.cache_hits += 1
+            else:
+                request_metrics.cache_misses += 1
+
+
+def record_prefetch(outcome):
+    if config.METRICS_ENABLED:
+        inc("toolify_prefetch_runs_total", (("outcome", outcome),))
+
+
+def record_first_page(state, seconds):
+    if config.METRICS_ENABLED and state is not None:
+        observe("toolify_prefetch_first_page_seconds", (("prefetch", state),), seconds, LATENCY_BUCKETS)
+
+
+def bind(function):
+    # Worker threads don't inherit the caller's context, so carry its request metrics over explicitly
+    request_metrics = current.get()
+
+    def bound(*args):
+        token = current.set(request_metrics)
+        try:
+            return function(*args)
+        finally:
+            current.reset(token)
+    return bound
+
+
+def start_request():
+    request_metrics = RequestMetrics()
+    current.set(request_metrics)
+    return request_metrics
+
+
+def finish_request(route, method, status, request_metrics):
+    labels = (("route", route),)
+    inc("toolify_http_requests_total", (("route", route), ("method", method), ("status", str(status))))
+    observe("toolify_http_request_duration_seconds", labels, time.perf_counter() - request_metrics.start, LATENCY_BUCKETS)
+    observe("toolify_http_request_spotify_calls", labels, request_metrics.calls, COUNT_BUCKETS)
+    observe("toolify_http_request_spotify_pages", labels, request_metrics.pages, COUNT_BUCKETS)
+
+
+def timing_header(request_metrics):
+    total = (time.perf_counter() - request_metrics.start) * 1000
+    return ", ".join([
+        f"app;dur={total:.1f}",
+        f'spotify;dur={request_metrics.spotify_seconds * 1000:.1f};desc="{request_metrics.calls} calls, {request_metrics.pages} pages, {request_metrics.bytes} bytes"',
+        f"queue;dur={request_metrics.queued_seconds * 1000:.1f}",
+        f'cache;desc="{request_metrics.cache_hits} hits, {request_metrics.cache_misses} misses"'
+    ])
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels) + "}"
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(caches, scheduler_stats):
+    with lock:
+        counter_items = sorted(counters.items())
+        histogram_items = sorted((key, (buckets, list(counts), total, count)) for key, (buckets, counts, total, count) in histograms.items())
+
+    samples = {}
+    for (name, labels), value in counter_items:
+        samples.setdefault(name, []).append(f"{name}{format_labels(labels)} {format_value(value)}")
+
+    for (name, labels), (buckets, counts, total, count) in histogram_items:
+        lines = samples.setdefault(name, [])
+        cumulative = 0
+        for bound, bucket_count in zip(buckets, counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', format_value(bound)),))} {cumulative}")
+        lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+        lines.append(f"{name}_sum{format_labels(labels)} {format_value(total)}")
+        lines.append(f"{name}_count{format_labels(labels)} {count}")
+
+    output = []
+    for name, lines in samples.items():
+        kind, description = DESCRIPTIONS[name]
+        output.append(f"# HELP {name} {description}")
+        output.append(f"# TYPE {name} {kind}")
+        output.extend(lines)
+
+    cache_stats = [caches[name].stats() for name in caches]
+    for field, kind in [("hits", "counter"), ("misses", "counter"), ("evictions", "counter"), ("entries", "gauge"), ("bytes", "gauge")]:
+        name = f"toolify_cache_{field}_total" if kind == "counter" else f"toolify_cache_{field}"
+        output.append(f"# HELP {name} Cache {field} by cache.")
+        output.append(f"# TYPE {name} {kind}")
+        output.extend(f'{name}{format_labels((("cache", stats["name"]), ("backend", stats["backend"])))} {stats[field]}' for stats in cache_stats)
+
+    for field, kind in [("requests", "counter"), ("throttled", "counter"), ("retries", "counter"), ("queued_seconds", "counter"), ("max_queued_seconds", "gauge")]:
+        name = f"toolify_rate_limit_{field}_total" if kind == "counter" else f"toolify_rate_limit_{field}"
+        output.append(f"# HELP {name} Rate limit scheduler {field.replace('_', ' ')}.")
+        output.append(f"# TYPE {name} {kind}")
+        output.append(f"{name} {format_value(scheduler_stats[field])}")
+
+    return "\n".join(output) + "\n"
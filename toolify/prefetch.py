@@ -0,0 +1,75 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import metrics
+import spotify
+
+executor = ThreadPoolExecutor(max_workers=config.PREFETCH_WORKERS)
+lock = threading.Lock()
+# One entry per user since their last login, oldest dropped first so the registry stays bounded
+entries = OrderedDict()
+
+
+class Cancelled(Exception):
+    pass
+
+
+def yield_to_foreground(cancelled):
+    # Background calls only go out while foreground requests would still find tokens left, and give up rather than queue for long
+    deadline = time.monotonic() + config.PREFETCH_MAX_WAIT
+    while not spotify.scheduler.has_headroom(config.PREFETCH_RESERVE_TOKENS):
+        if time.monotonic() > deadline:
+            raise Cancelled()
+        if cancelled.wait(config.PREFETCH_BACKOFF):
+            break
+    if cancelled.is_set():
+        raise Cancelled()
+
+
+def run(entry, function):
+    if entry["cancelled"].is_set():
+        outcome = "cancelled"
+    else:
+        entry["state"] = "running"
+        try:
+            outcome = function(entry["cancelled"])
+        except Cancelled:
+            outcome = "cancelled"
+        except (spotify.SpotifyError, OSError):
+            outcome = "failed"
+
+    entry["state"] = "warm" if outcome in ["stored", "fresh"] else "cold"
+    metrics.record_prefetch(outcome)
+
+
+def start(user_id, function):
+    entry = {"state": "queued" if config.PREFETCH_ENABLED else "disabled", "cancelled": threading.Event()}
+    with lock:
+        previous = entries.pop(user_id, None)
+        if previous:
+            previous["cancelled"].set()
+        entries[user_id] = entry
+        while len(entries) > config.PREFETCH_MAX_USERS:
+            entries.popitem(last=False)[1]["cancelled"].set()
+        pending = sum(1 for other in entries.values() if other["state"] in ["queued", "running"])
+
+    if entry["state"] == "disabled":
+        return
+    if pending > config.PREFETCH_MAX_PENDING:
+        entry["state"] = "cold"
+        metrics.record_prefetch("dropped")
+        return
+    executor.submit(run, entry, function)
+
+
+def claim(user_id):
+    # The first index load after login takes the entry, stopping a prefetch that hasn't finished so it can't race the foreground fetch
+    with lock:
+        entry = entries.pop(user_id, None)
+    if entry is None:
+        return None
+    entry["cancelled"].set()
+    return entry["state"] if entry["state"] in ["warm", "disabled"] else "cold"
@@ -0,0 +1,174 @@
+import csv
+import os
+from datetime import datetime
+from itertools import islice
+
+import cache
+import config
+from helpers import bounded_map, playlist_index_cache
+import jobs
+import restore_parser
+import spotify
+
+isrc_cache = cache.create_cache("isrc", config.ISRC_CACHE_MAX_ENTRIES, config.ISRC_CACHE_MAX_BYTES, config.ISRC_CACHE_TTL, backend=config.ISRC_CACHE_BACKEND)
+
+
+def upload_path(job_id):
+    return os.path.join(config.UPLOAD_DIR, f"{job_id}.csv")
+
+
+def match_report_path(job_id):
+    return os.path.join(config.UPLOAD_DIR, f"{job_id}-matches.csv")
+
+
+jobs.artifacts["restore"] = [upload_path, match_report_path]
+
+
+def playable_tracks(track_ids, headers):
+    # Maps each requested ID to the ID Spotify plays for it in the user's market, or None when unavailable
+    response = spotify.get(f"{config.API_URL}/tracks", params={"ids": ",".join(track_ids), "market": "from_token"}, headers=headers)
+    if response.status_code != 200:
+        raise spotify.response_error(response)
+
+    playable = {}
+    for track_id, track in zip(track_ids, response.json().get("tracks", [])):
+        playable[track_id] = track["id"] if track and track.get("is_playable", True) else None
+    return playable
+
+
+def search_isrc(isrc, headers):
+    response = spotify.get(f"{config.API_URL}/search", params={"q": f"isrc:{isrc}", "type": "track", "market": "from_token", "limit": 1}, headers=headers)
+    if response.status_code != 200:
+        raise spotify.response_error(response)
+
+    items = response.json().get("tracks", {}).get("items", [])
+    return items[0]["id"] if items and items[0] else None
+
+
+def match_isrcs(isrcs, headers):
+    matches = isrc_cache.get_many(isrcs)
+    missing = [isrc for isrc in isrcs if isrc not in matches]
+
+    found = {}
+    for isrc, track_id in zip(missing, bounded_map(lambda isrc: search_isrc(isrc, headers), missing, config.RESTORE_MATCH_WORKERS)):
+        if track_id:
+            found[isrc] = track_id
+    # Misses aren't cached, the track may be playable in another user's market
+    isrc_cache.set_many(found)
+
+    matches.update(found)
+    return matches
+
+
+def match_tracks(rows, headers, report, writer):
+    seen = set()
+    for chunk in iter(lambda: list(islice(rows, config.RESTORE_MATCH_CHUNK)), []):
+        # Tracks exported with an ISRC are checked first so relinked or unavailable ones can fall back to it
+        checked = [track_id for line, track_id, isrc in chunk if track_id and isrc]
+        playable = {}
+        for result in bounded_map(lambda ids: playable_tracks(ids, headers), [checked[i:i + 50] for i in range(0, len(checked), 50)], config.RESTORE_MATCH_WORKERS):
+            playable.update(result)
+
+        isrcs = list(dict.fromkeys(isrc for line, track_id, isrc in chunk if isrc and (not track_id or playable.get(track_id) is None)))
+        matches = match_isrcs(isrcs, headers)
+
+        for line, track_id, isrc in chunk:
+            if track_id and not isrc:
+                match, status = track_id, "matched"
+            elif track_id and playable.get(track_id):
+                match = playable[track_id]
+                status = "matched" if match == track_id else "relinked"
+            elif matches.get(isrc):
+                match, status = matches[isrc], "isrc_matched"
+            else:
+                match, status = None, "unmatched"
+                restore_parser.add_error(report, line, track_id or isrc, "Track unavailable and no ISRC match found" if track_id else "No track found for ISRC")
+
+            if match in seen:
+                status = "duplicates"
+            report[status] += 1
+            writer.writerow([line, track_id or "", isrc or "", status, match or ""])
+
+            if status not in ["unmatched", "duplicates"]:
+                seen.add(match)
+                yield match
+
+
+def restored_track_count(playlist_id, headers):
+    response = spotify.get(f"{config.API_URL}/playlists/{playlist_id}", params={"fields": "tracks.total"}, headers=headers)
+    if response.status_code != 200:
+        return None
+    return response.json()["tracks"]["total"]
+
+
+def restore_playlist(job_id, access_token):
+    path = upload_path(job_id)
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json"
+    }
+
+    try:
+        column, isrc_column = restore_parser.find_columns(path)
+        first_row = next(restore_parser.parse_rows(path, column, isrc_column), None)
+    except (OSError, UnicodeDecodeError, csv.Error):
+        raise jobs.JobError("Failed to read CSV file. Please make sure it's properly formatted.")
+    if first_row is None:
+        raise jobs.JobError("CSV is empty.")
+
+    checkpoint = jobs.get_job(job_id)["result"] or {}
+    playlist_id = checkpoint.get("playlist_id")
+
+    if playlist_id:
+        # Resume after the last batch Spotify actually committed instead of creating a duplicate playlist
+        added = restored_track_count(playlist_id, headers)
+        if added is None:
+            added = checkpoint.get("added", 0)
+    else:
+        data = {
+            "name": f"Restored Playlist {datetime.now().strftime('%Y-%m-%d')}"
+        }
+
+        response = spotify.get(f"{config.API_URL}/me", headers=headers)
+        if response.status_code != 200:
+            raise jobs.JobError("Unable to access your Spotify account. Please login again.")
+        user_id = response.json().get("id")
+
+        create_playlist = spotify.post(f"{config.API_URL}/users/{user_id}/playlists", headers=headers, json=data)
+        if create_playlist.status_code not in [200, 201]:
+            raise jobs.JobError("Failed to create playlist. Please try again.")
+        playlist_id = create_playlist.json().get("id")
+        playlist_index_cache.delete(user_id)
+        added = 0
+        # Checkpoint the new playlist before anything else can fail, so a resume adds to it rather than creating another
+        jobs.update_job(job_id, result={"playlist_id": playlist_id, "added": added, "report": restore_parser.new_report()})
+
+    report = restore_parser.new_report()
+    jobs.update_job(job_id, progress=0, total=restore_parser.count_rows(path), result={"playlist_id": playlist_id, "added": added, "report": report})
+
+    rows = restore_parser.parse_rows(path, column, isrc_column, report)
+    try:
+        with open(match_report_path(job_id), "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(["Line", "Track ID", "ISRC", "Status", "Restored ID"])
+            tracks = match_tracks(rows, headers, report, writer)
+
+            # Skip the tracks committed by an earlier run of this job
+            next(islice(tracks, added, added), None)
+            for batch in iter(lambda: list(islice(tracks, 100)), []):
+                uris = [f"spotify:track:{track_id}" for track_id in batch]
+                track_uris = {
+                    "uris": uris,
+                }
+                add_to_playlist = spotify.post(f"{config.API_URL}/playlists/{playlist_id}/tracks", headers=headers, json=track_uris)
+                if add_to_playlist.status_code not in [200, 201]:
+                    raise jobs.JobError("Failed to restore playlist. Please try again.")
+                added += len(batch)
+                jobs.update_job(job_id, progress=report["rows"], result={"playlist_id": playlist_id, "added": added, "report": report})
+    except (UnicodeDecodeError, csv.Error):
+        raise jobs.JobError("Failed to read CSV file. Please make sure it's properly formatted.")
+    except spotify.SpotifyError:
+        raise jobs.JobError("Failed to match tracks. Please try again.")
+
+    os.remove(path)
+    return {"playlist_id": playlist_id, "added": added, "report": report}
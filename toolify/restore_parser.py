@@ -0,0 +1,100 @@
+import csv
+import re
+
+import config
+
+TRACK_EXPRESSION = re.compile(r"(?:track[/:])([A-Za-z0-9]{22})")
+TRACK_URI_PREFIX = "spotify:track:"
+ISRC_EXPRESSION = re.compile(r"[A-Z]{2}[A-Z0-9]{3}[0-9]{7}")
+COLUMNS = ["url", "spotify_id"]
+ISRC_COLUMN = "ISRC"
+
+
+def open_upload(path):
+    return open(path, newline="", encoding="utf-8-sig", buffering=config.RESTORE_READ_CHUNK)
+
+
+def find_columns(path):
+    with open_upload(path) as file:
+        header = next(csv.reader(file), [])
+
+    column = next((column for column in COLUMNS if column in header), None)
+    isrc_column = ISRC_COLUMN if ISRC_COLUMN in header else None
+    return column, isrc_column
+
+
+def count_rows(path):
+    rows = 0
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(config.RESTORE_READ_CHUNK), b""):
+            rows += chunk.count(b"\n")
+    return max(rows - 1, 0)
+
+
+def extract_track_id(value):
+    # Backups written by this app store bare URIs, which skip the regex entirely
+    if value.startswith(TRACK_URI_PREFIX) and len(value) == 36:
+        track_id = value[14:]
+        if track_id.isascii() and track_id.isalnum():
+            return track_id
+
+    match = TRACK_EXPRESSION.search(value)
+    return match.group(1) if match else None
+
+
+def extract_isrc(value):
+    value = value.replace("-", "").upper()
+    return value if ISRC_EXPRESSION.fullmatch(value) else None
+
+
+def new_report():
+    return {"rows": 0, "duplicates": 0, "invalid": 0, "matched": 0, "relinked": 0, "isrc_matched": 0, "unmatched": 0, "errors": []}
+
+
+def add_error(report, line, value, error):
+    if len(report["errors"]) < config.RESTORE_MAX_ERRORS:
+        report["errors"].append({"line": line, "value": value[:100], "error": error})
+
+
+def parse_rows(path, column, isrc_column=None, report=None):
+    if report is None:
+        report = new_report()
+
+    seen = set()
+    with open_upload(path) as file:
+        reader = csv.reader(file)
+        header = next(reader)
+        index = header.index(column) if column else None
+        isrc_index = header.index(isrc_column) if isrc_column else None
+
+        for line, row in enumerate(reader, start=2):
+            if not row:
+                continue
+            report["rows"] += 1
+
+            value = row[index].strip() if index is not None and index < len(row) else ""
+            track_id = extract_track_id(value) if value else None
+            isrc_value = row[isrc_index].strip() if isrc_index is not None and isrc_index < len(row) else ""
+            isrc = extract_isrc(isrc_value) if isrc_value else None
+
+            if track_id is None and isrc is None:
+                report["invalid"] += 1
+                value = value or isrc_value
+                if value:
+                    add_error(report, line, value, "No Spotify track ID or ISRC found")
+                else:
+                    add_error(report, line, value, f"Missing '{column or isrc_column}' value")
+                continue
+
+            key = track_id or isrc
+            if key in seen:
+                report["duplicates"] += 1
+                continue
+
+            seen.add(key)
+            yield line, track_id, isrc
+
+
+def parse_track_ids(path, column, report=None):
+    for line, track_id, isrc in parse_rows(path, column, report=report):
+        yield track_id
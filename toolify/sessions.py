@@ -0,0 +1,156 @@
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask.json.tag import JSONTag, TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+import config
+
+
+class TagNaiveDateTime(JSONTag):
+    # The default datetime tag goes through an HTTP date and comes back timezone aware,
+    # which breaks comparisons against the naive datetimes the app stores
+    key = " dn"
+
+    def check(self, value):
+        return isinstance(value, datetime) and value.tzinfo is None
+
+    def to_json(self, value):
+        return value.isoformat()
+
+    def to_python(self, value):
+        return datetime.fromisoformat(value)
+
+
+serializer = TaggedJSONSerializer()
+serializer.register(TagNaiveDateTime, index=0)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class MemorySessionStore:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def load(self, sid):
+        with self.lock:
+            entry = self.entries.get(sid)
+            if entry is None or entry[0] < time.time():
+                self.entries.pop(sid, None)
+                return None
+            self.entries.move_to_end(sid)
+            return entry[1]
+
+    def save(self, sid, data, lifetime):
+        with self.lock:
+            self.entries[sid] = (time.time() + lifetime, data)
+            self.entries.move_to_end(sid)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, sid):
+        with self.lock:
+            self.entries.pop(sid, None)
+
+
+class SQLiteSessionStore:
+    def __init__(self, path, cleanup_interval):
+        self.path = path
+        self.local = threading.local()
+        with self.connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT, expires REAL)")
+            db.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires)")
+
+        if cleanup_interval > 0:
+            threading.Thread(target=self.cleanup, args=(cleanup_interval,), daemon=True).start()
+
+    def connect(self):
+        if not hasattr(self.local, "db"):
+            self.local.db = sqlite3.connect(self.path, timeout=30)
+            self.local.db.execute("PRAGMA journal_mode=WAL")
+            self.local.db.execute("PRAGMA synchronous=NORMAL")
+        return self.local.db
+
+    def load(self, sid):
+        row = self.connect().execute("SELECT data FROM sessions WHERE id = ? AND expires > ?", (sid, time.time())).fetchone()
+        return row[0] if row else None
+
+    def save(self, sid, data, lifetime):
+        with self.connect() as db:
+            db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (sid, data, time.time() + lifetime))
+
+    def delete(self, sid):
+        with self.connect() as db:
+            db.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+
+    def cleanup(self, interval):
+        while True:
+            time.sleep(interval)
+            with self.connect() as db:
+                db.execute("DELETE FROM sessions WHERE expires < ?", (time.time(),))
+
+
+class StoreSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            data = self.store.load(sid)
+            if data is not None:
+                return ServerSession(serializer.loads(data), sid=sid)
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        # Only write when something changed so plain page views cost a single read
+        if not session.modified:
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        self.store.save(session.sid, serializer.dumps(dict(session)), lifetime)
+
+        if session.new:
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+                domain=domain,
+                path=path
+            )
+
+
+def create_session_interface(backend=None):
+    backend = backend or config.SESSION_BACKEND
+    if backend == "memory":
+        return StoreSessionInterface(MemorySessionStore(config.SESSION_MAX_ENTRIES))
+    return StoreSessionInterface(SQLiteSessionStore(config.SESSION_DB, config.SESSION_CLEANUP_INTERVAL))
@@ -0,0 +1,174 @@
+import asyncio
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+import metrics
+
+
+class SpotifyError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"Spotify API returned {status_code}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Scheduler:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.retries = 0
+        self.queued_seconds = 0.0
+        self.max_queued_seconds = 0.0
+
+    def reserve(self):
+        # Takes a token and returns 0, or returns how long to wait before trying again
+        with self.lock:
+            now = time.monotonic()
+            wait = self.blocked_until - now
+            if wait > 0:
+                return wait
+            if self.rate <= 0:
+                return 0
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def record(self, start):
+        queued = time.monotonic() - start
+        with self.lock:
+            self.requests += 1
+            self.queued_seconds += queued
+            self.max_queued_seconds = max(self.max_queued_seconds, queued)
+        return queued
+
+    def acquire(self):
+        start = time.monotonic()
+        while (wait := self.reserve()) > 0:
+            # Jitter keeps queued callers from waking up and retrying all at once
+            time.sleep(wait + random.uniform(0, config.RATE_LIMIT_JITTER))
+        return self.record(start)
+
+    async def acquire_async(self):
+        start = time.monotonic()
+        while (wait := self.reserve()) > 0:
+            await asyncio.sleep(wait + random.uniform(0, config.RATE_LIMIT_JITTER))
+        return self.record(start)
+
+    def has_headroom(self, reserve):
+        # True while a caller could take a token and still leave `reserve` for everyone else
+        with self.lock:
+            now = time.monotonic()
+            if self.blocked_until > now:
+                return False
+            if self.rate <= 0:
+                return True
+            return min(self.burst, self.tokens + (now - self.updated) * self.rate) >= reserve + 1
+
+    def throttle(self, retry_after):
+        with self.lock:
+            self.throttled += 1
+            self.retries += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "queued_seconds": round(self.queued_seconds, 3),
+                "max_queued_seconds": round(self.max_queued_seconds, 3)
+            }
+
+
+def create_session(pool_size):
+    retries = Retry(
+        total=config.HTTP_RETRIES,
+        backoff_factor=config.HTTP_BACKOFF,
+        status_forcelist=[500, 502, 503, 504],
+        allowed_methods=["GET"],
+        # 429s are left to the scheduler so every caller backs off together
+        respect_retry_after_header=False,
+        raise_on_status=False
+    )
+    # Callers past pool_size wait for a free connection instead of opening one that is thrown away afterwards
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries, pool_block=True)
+
+    http = requests.Session()
+    http.mount("https://", adapter)
+    http.mount("http://", adapter)
+    return http
+
+
+scheduler = Scheduler(config.RATE_LIMIT_PER_SECOND, config.RATE_LIMIT_BURST)
+api_session = create_session(config.API_POOL_SIZE)
+accounts_session = create_session(config.ACCOUNTS_POOL_SIZE)
+
+
+def session_for(url):
+    # Checked first, the accounts URL is a prefix of the API URL when both point at one host
+    if url.startswith(config.API_URL):
+        return api_session
+    if url.startswith(config.ACCOUNTS_URL):
+        return accounts_session
+    return api_session
+
+
+def retry_delay(response, attempt):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return config.HTTP_BACKOFF * 2 ** attempt
+
+
+def response_error(response):
+    # A 429 that request() gave up on keeps its Retry-After so the caller can tell the user how long to wait
+    return SpotifyError(response.status_code, retry_delay(response, 0) if response.status_code == 429 else None)
+
+
+def request(method, url, **kwargs):
+    kwargs.setdefault("timeout", config.HTTP_TIMEOUT)
+    paginated = "offset" in (kwargs.get("params") or {})
+    attempt = 0
+    while True:
+        queued = scheduler.acquire()
+        start = time.perf_counter()
+        try:
+            response = session_for(url).request(method, url, **kwargs)
+        except requests.RequestException:
+            metrics.record_call(method, url, "error", time.perf_counter() - start, 0, queued, paginated)
+            raise
+        metrics.record_call(method, url, response.status_code, time.perf_counter() - start, len(response.content), queued, paginated)
+
+        if response.status_code != 429 or attempt >= config.RATE_LIMIT_RETRIES:
+            return response
+
+        retry_after = retry_delay(response, attempt)
+        if retry_after > config.RATE_LIMIT_MAX_WAIT:
+            return response
+
+        scheduler.throttle(retry_after)
+        attempt += 1
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
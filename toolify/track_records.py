@@ -0,0 +1,29 @@
+# Spotify is asked for only the fields the exporters, analytics and backups read, and each playlist item
+# is reduced to a TrackRecord as its page is parsed, so raw item JSON never outlives the page it came in
+ITEM_FIELDS = "items(added_at,track(name,uri,duration_ms,explicit,popularity,external_urls(spotify),external_ids(isrc),album(name,release_date),artists(id,name))),limit,offset,total"
+
+
+class TrackRecord:
+    __slots__ = ["name", "added_at", "url", "uri", "album", "release_date", "artist_ids", "artist_names", "duration_ms", "isrc", "explicit", "popularity"]
+
+    def __init__(self, song):
+        track = song["track"]
+        album = track.get("album") or {}
+        artists = [artist for artist in track.get("artists") or [] if artist]
+
+        self.name = track.get("name")
+        self.added_at = song.get("added_at")
+        self.url = (track.get("external_urls") or {}).get("spotify")
+        self.uri = track.get("uri")
+        self.album = album.get("name")
+        self.release_date = album.get("release_date")
+        self.artist_ids = tuple(artist["id"] for artist in artists if artist.get("id"))
+        self.artist_names = tuple(artist.get("name") or "" for artist in artists)
+        self.duration_ms = track.get("duration_ms")
+        self.isrc = (track.get("external_ids") or {}).get("isrc")
+        self.explicit = track.get("explicit")
+        self.popularity = track.get("popularity")
+
+
+def parse_items(items):
+    return [TrackRecord(song) for song in items if song and song.get("track")]